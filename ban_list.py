@@ -0,0 +1,145 @@
+"""
+In-memory ban list of KT Football bot
+©Viktor Sharov, 2024
+"""
+
+import asyncio
+import logging
+import math
+import time
+
+from database import FootballBotDatabase
+
+logger = logging.getLogger(__name__)
+
+
+class BanList:
+    """
+    Per-chat sets of banned users, loaded from `ban` table once at start.
+    is_banned() is served from memory and expires entries by their end timestamp;
+    ban table is changed only through this class, which keeps memory in sync.
+    Background task removes expired rows from database when bans end.
+    """
+
+    #global instance
+    global_instance = None
+
+    # maximal interval between purges of expired bans, seconds
+    PURGE_PERIOD = 3600
+
+    def __init__(self):
+        # chat_id -> {user_id: end timestamp}; math.inf for permanent ban
+        self.__chats = {}
+        self.__on_change = None
+        self.__wakeup = asyncio.Event()
+        self.__task = None
+
+    async def start(self, on_change=None):
+        """
+        Load active bans and start purge task in current event loop
+        :param on_change: coroutine function on_change(chat_id) called when bans of chat expired
+        """
+        self.__on_change = on_change
+        await self.load()
+        if self.__task is None:
+            self.__task = asyncio.get_running_loop().create_task(self.__run())
+
+    async def stop(self):
+        if self.__task is not None:
+            self.__task.cancel()
+            try:
+                await self.__task
+            except asyncio.CancelledError:
+                pass
+            self.__task = None
+
+    async def load(self):
+        """Load active bans of all chats"""
+        chats = {}
+        for chat_id, user_id, end_timestamp in await FootballBotDatabase.instance().get_active_bans(time.time()):
+            chats.setdefault(chat_id, {})[user_id] = math.inf if end_timestamp is None else end_timestamp
+        self.__chats = chats
+        self.__wakeup.set()
+        logger.info(f"Loaded bans of {len(chats)} chats")
+
+    async def reload_chat(self, chat_id: int):
+        """Load bans of chat again, e.g. after chat data was imported"""
+        rows = await FootballBotDatabase.instance().get_active_bans(time.time(), chat_id)
+        self.__chats[chat_id] = {user_id: math.inf if end is None else end for _, user_id, end in rows}
+        self.__wakeup.set()
+
+    def drop_chat(self, chat_id: int):
+        self.__chats.pop(chat_id, None)
+
+    def is_banned(self, chat_id: int, user_id: int) -> bool:
+        chat = self.__chats.get(chat_id)
+        if not chat:
+            return False
+        # expired entries are removed together with database rows by purge task
+        return chat.get(user_id, 0.0) > time.time()
+
+    def banned_users(self, chat_id: int) -> dict:
+        """
+        :return: user_id -> end timestamp (math.inf for permanent ban) of active bans in chat
+        """
+        now = time.time()
+        return {user_id: end for user_id, end in self.__chats.get(chat_id, {}).items() if end > now}
+
+    async def ban(self, chat_id: int, user_id: int, end_timestamp: float = None):
+        """
+        Ban user in chat until end_timestamp, None for permanent ban
+        """
+        await FootballBotDatabase.instance().add_ban(chat_id, user_id, end_timestamp)
+        self.__chats.setdefault(chat_id, {})[user_id] = math.inf if end_timestamp is None else end_timestamp
+        # purge task sleeps until the earliest end of ban
+        self.__wakeup.set()
+
+    async def unban(self, chat_id: int, user_id: int) -> bool:
+        """
+        :return: False if user was not banned
+        """
+        removed = await FootballBotDatabase.instance().remove_ban(chat_id, user_id)
+        self.__chats.get(chat_id, {}).pop(user_id, None)
+        return removed
+
+    def __next_expiry(self) -> float:
+        return min((end for chat in self.__chats.values() for end in chat.values()), default=math.inf)
+
+    async def __run(self):
+        while True:
+            self.__wakeup.clear()
+            timeout = min(self.PURGE_PERIOD, self.__next_expiry() - time.time())
+            if timeout > 0:
+                try:
+                    await asyncio.wait_for(self.__wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self.purge()
+            except Exception as e:
+                logger.error(f"Purge of expired bans failed: {repr(e)}")
+                await asyncio.sleep(self.PURGE_PERIOD)
+
+    async def purge(self):
+        """Remove expired bans from database and memory"""
+        now = time.time()
+        changed = set()
+        for chat_id, user_id in await FootballBotDatabase.instance().purge_expired_bans(now):
+            chat = self.__chats.get(chat_id, {})
+            if chat.get(user_id, math.inf) <= now:
+                del chat[user_id]
+            changed.add(chat_id)
+        # entries expired in memory only (row removed by another process or shard move)
+        for chat_id, chat in self.__chats.items():
+            for user_id in [u for u, end in chat.items() if end <= now]:
+                del chat[user_id]
+        if self.__on_change is not None:
+            for chat_id in changed:
+                await self.__on_change(chat_id)
+
+    @staticmethod
+    def instance() -> "BanList":
+        if BanList.global_instance is None:
+            BanList.global_instance = BanList()
+        return BanList.global_instance
@@ -0,0 +1,92 @@
+"""
+Micro-benchmark: f-string SQL vs parameterized SQL with prepared statement cache
+Every f-string query is a new SQL text which SQLite has to parse and plan again;
+parameterized query is parsed once and reused from sqlite3 statement cache.
+
+Run: python benchmarks/bench_db_queries.py [count]
+"""
+
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from database import FootballBotDatabase
+
+
+def create_db(cached_statements):
+    db = sqlite3.connect(":memory:", cached_statements=cached_statements)
+    for migration in FootballBotDatabase.MIGRATIONS:
+        for sql in migration:
+            db.execute(sql)
+    return db
+
+
+def rows(count):
+    for i in range(count):
+        yield (f"Футбол {i}", 1700000000.0 + i * 3600, "вул. Лип'янська, 6-А", 1700000000.0 + i, i, i % 50, 21)
+
+
+def insert_fstring(db, count):
+    for title, event_time, address, message_time, message_id, chat_id, players_limit in rows(count):
+        title = title.replace("'", "")
+        address = address.replace("'", "")
+        db.execute(
+            f"insert into event(event_title, event_time, event_address, message_timestamp, message_id, chat_id, players_limit) "
+            f"values('{title}', '{event_time}', '{address}', '{message_time}', '{message_id}', '{chat_id}', '{players_limit}')"
+        )
+
+
+def insert_params(db, count):
+    for params in rows(count):
+        db.execute(FootballBotDatabase.SQL_INSERT_EVENT, params)
+
+
+def fill_members(db, count):
+    for i in range(count):
+        db.execute(
+            "insert into event_member(event_id, user_id, name, username, join_timestamp) values(?, ?, ?, ?, ?)",
+            (i % 1000, i, f"Гравець {i}", "", 1700000000.0 + i),
+        )
+
+
+def select_fstring(db, count):
+    for i in range(count):
+        db.execute(f"select * from event_member where event_id={i % 1000} order by join_timestamp").fetchall()
+
+
+def select_params(db, count):
+    for i in range(count):
+        db.execute(FootballBotDatabase.SQL_SELECT_MEMBERS, (i % 1000,)).fetchall()
+
+
+def measure(name, func, cached_statements, count):
+    db = create_db(cached_statements)
+    if func in (select_fstring, select_params):
+        fill_members(db, count)
+    start = time.perf_counter()
+    func(db, count)
+    elapsed = time.perf_counter() - start
+    db.close()
+    print(f"{name:<40} {elapsed * 1000:9.1f} ms  {elapsed / count * 1e6:7.2f} us/query")
+    return elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"{count} queries, SQLite {sqlite3.sqlite_version}")
+    cache = FootballBotDatabase.STATEMENT_CACHE_SIZE
+    base = measure("insert: f-string SQL", insert_fstring, cache, count)
+    measure("insert: parameterized, no stmt cache", insert_params, 0, count)
+    fast = measure("insert: parameterized, stmt cache", insert_params, cache, count)
+    print(f"insert speedup: x{base / fast:.2f}")
+    base = measure("select: f-string SQL", select_fstring, cache, count)
+    measure("select: parameterized, no stmt cache", select_params, 0, count)
+    fast = measure("select: parameterized, stmt cache", select_params, cache, count)
+    print(f"select speedup: x{base / fast:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark and correctness check of event command parser (Event.update_param)
+Corpus of command texts with expected results is in event_commands.json;
+relative dates are given as "day_offset" from today.
+
+Run: python benchmarks/bench_event_parser.py [repeat]
+"""
+
+import datetime
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from event import Event
+
+CORPUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "event_commands.json")
+
+
+def check(item) -> list[str]:
+    event = Event(item["text"])
+    expected = item["expected"]
+    errors = []
+    for key in ("title", "address", "players_limit"):
+        if key in expected and getattr(event, key) != expected[key]:
+            errors.append(f"{key}: {getattr(event, key)!r} != {expected[key]!r}")
+    if "date" in expected and event.time.date().isoformat() != expected["date"]:
+        errors.append(f"date: {event.time.date()} != {expected['date']}")
+    if "day_offset" in expected:
+        date = datetime.date.today() + datetime.timedelta(days=expected["day_offset"])
+        if event.time.date() != date:
+            errors.append(f"date: {event.time.date()} != {date}")
+    if "clock" in expected and event.time.strftime("%H:%M") != expected["clock"]:
+        errors.append(f"time: {event.time.strftime('%H:%M')} != {expected['clock']}")
+    return errors
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with open(CORPUS_FILE, encoding="utf-8") as f:
+        corpus = json.load(f)
+
+    failed = 0
+    for item in corpus:
+        errors = check(item)
+        if errors:
+            failed += 1
+            print(f"FAIL {item['text']!r}: {'; '.join(errors)}")
+    print(f"correctness: {len(corpus) - failed}/{len(corpus)} passed")
+
+    texts = [item["text"] for item in corpus]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            Event(text)
+    elapsed = time.perf_counter() - start
+    count = repeat * len(texts)
+    print(f"parse: {count} messages in {elapsed * 1000:.1f} ms, {elapsed / count * 1e6:.2f} us/message")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
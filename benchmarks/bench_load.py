@@ -0,0 +1,247 @@
+"""
+Load test of KT Football bot against local fake Telegram Bot API server
+Replays synthetic /kt_add_event commands and bursts of button clicks in many chats through
+application built by kt_football_bot.build_application() with its post_init() startup, event cache
+and SQLite database; works offline.
+Reports throughput, p50/p99 handler latency, outgoing Bot API calls and SQLite contention.
+
+Run: python benchmarks/bench_load.py [--chats 50] [--players 40] [--clicks 2]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from urllib.parse import parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from telegram import Update
+
+import database as bot_db
+import kt_football_bot as bot
+import metrics
+
+BOT_TOKEN = "123456:LOAD-TEST"
+
+
+class FakeBotApi:
+    """
+    Minimal HTTP/1.1 server which answers Bot API methods used by the bot and counts calls
+    """
+
+    def __init__(self):
+        self.calls = {}
+        # (chat_id, message_id) -> callback data of buttons
+        self.buttons = {}
+        self.port = None
+        self.__server = None
+        self.__message_id = 1000
+
+    async def start(self):
+        self.__server = await asyncio.start_server(self.__client, "127.0.0.1", 0)
+        self.port = self.__server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.__server.close()
+        await self.__server.wait_closed()
+
+    async def __client(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                method = request_line.decode("latin-1").split()[1].rsplit("/", 1)[-1]
+                result = self.__call(method, self.__params(headers.get("content-type", ""), body))
+                payload = json.dumps({"ok": True, "result": result}).encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: " + str(len(payload)).encode() + b"\r\n\r\n" + payload)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def __params(content_type, body) -> dict:
+        if not body:
+            return {}
+        if content_type.startswith("application/json"):
+            return json.loads(body)
+        return {k: v[0] for k, v in parse_qs(body.decode()).items()}
+
+    def __call(self, method, params):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if method == "getMe":
+            return {"id": 123456, "is_bot": True, "first_name": "KT Football", "username": "kt_football_bot"}
+        if method in ("sendMessage", "editMessageText"):
+            chat_id = int(params["chat_id"])
+            if method == "sendMessage":
+                self.__message_id += 1
+                message_id = self.__message_id
+            else:
+                message_id = int(params["message_id"])
+            markup = params.get("reply_markup")
+            if markup:
+                markup = json.loads(markup) if isinstance(markup, str) else markup
+                self.buttons[(chat_id, message_id)] = [
+                    b["callback_data"] for row in markup["inline_keyboard"] for b in row
+                ]
+            return {"message_id": message_id, "date": int(time.time()), "text": params.get("text", ""),
+                    "chat": {"id": chat_id, "type": "group", "title": f"chat {chat_id}"}}
+        return True
+
+
+class Stats:
+    def __init__(self):
+        self.latency = {}
+
+    def add(self, name, value):
+        self.latency.setdefault(name, []).append(value)
+
+    @staticmethod
+    def percentile(values, p):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+    def report(self):
+        for name, values in self.latency.items():
+            print(f"{name:<24} count={len(values):<7} p50={self.percentile(values, 50) * 1000:8.2f} ms "
+                  f"p99={self.percentile(values, 99) * 1000:8.2f} ms")
+
+
+def timed(stats, name, func):
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            stats.add(name, time.perf_counter() - start)
+    return wrapper
+
+
+class Replay:
+    def __init__(self, app, api, stats):
+        self.app = app
+        self.api = api
+        self.stats = stats
+        self.__update_id = 0
+        self.__message_id = 1
+
+    def __chat(self, chat_id):
+        return {"id": chat_id, "type": "group", "title": f"chat {chat_id}"}
+
+    @staticmethod
+    def __user(user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"Гравець {user_id}", "username": f"player{user_id}"}
+
+    async def __process(self, name, data):
+        self.__update_id += 1
+        data["update_id"] = self.__update_id
+        update = Update.de_json(data, self.app.bot)
+        start = time.perf_counter()
+        await self.app.process_update(update)
+        self.stats.add(name, time.perf_counter() - start)
+
+    async def create_event(self, chat_id, hour):
+        self.__message_id += 1
+        text = f"/kt_add_event title=Гра {hour}; address=Поле {chat_id}; time=завтра {hour}:00; limit=20"
+        await self.__process("kt_create_event", {"message": {
+            "message_id": self.__message_id, "date": int(time.time()), "chat": self.__chat(chat_id),
+            "from": self.__user(1), "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len("/kt_add_event")}],
+        }})
+
+    async def click(self, chat_id, message_id, user_id, data):
+        await self.__process("button", {"callback_query": {
+            "id": f"{chat_id}-{user_id}-{self.__update_id}", "from": self.__user(user_id), "chat_instance": str(chat_id),
+            "data": data,
+            "message": {"message_id": message_id, "date": int(time.time()), "chat": self.__chat(chat_id), "text": "."},
+        }})
+
+    async def chat_storm(self, chat_id, args):
+        for hour in range(args.events):
+            await self.create_event(chat_id, 18 + hour)
+        for (msg_chat, message_id), buttons in list(self.api.buttons.items()):
+            if msg_chat != chat_id:
+                continue
+            for n in range(args.clicks):
+                for user_id in range(args.players):
+                    # every second click round half of players leave
+                    data = buttons[1] if n % 2 and user_id % 2 else buttons[0]
+                    await self.click(chat_id, message_id, 1000 + user_id, data)
+
+
+async def run(args):
+    stats = Stats()
+    api = FakeBotApi()
+    await api.start()
+    db_dir = tempfile.mkdtemp(prefix="kt_football_bench_")
+
+    # measure SQLite side: write path and group commits
+    db_class = bot_db.FootballBotDatabase
+    db_class.add_member = timed(stats, "db.add_member", db_class.add_member)
+    db_class.flush = timed(stats, "db.flush (commit)", db_class.flush)
+    # the same configuration, handler chain and startup as production bot
+    bot.configure({
+        "db_path": os.path.join(db_dir, "bench.db"),
+        "db_commit_delay": args.commit_delay,
+        "edit_coalesce_window": args.window,
+        "edit_chat_interval": args.chat_interval,
+        "metrics_port": 0,
+    })
+    app = bot.build_application(BOT_TOKEN, updater=False, api_url=f"http://127.0.0.1:{api.port}/bot")
+
+    replay = Replay(app, api, stats)
+    async with app:
+        await bot.post_init(app)
+        start = time.perf_counter()
+        # chats are independent and run concurrently; updates of one chat are processed in order
+        await asyncio.gather(*[replay.chat_storm(chat_id, args) for chat_id in range(-1000, -1000 - args.chats, -1)])
+        elapsed = time.perf_counter() - start
+        # stops background tasks and closes database
+        await bot.post_stop(app)
+    await api.stop()
+    shutil.rmtree(db_dir, ignore_errors=True)
+
+    updates = sum(len(v) for k, v in stats.latency.items() if not k.startswith("db."))
+    print(f"{args.chats} chats x {args.events} events, {args.players} players x {args.clicks} clicks")
+    print(f"updates: {updates} in {elapsed:.2f} s, throughput {updates / elapsed:.0f} updates/s")
+    stats.report()
+    print("outgoing Bot API calls: " + ", ".join(f"{k}={v}" for k, v in sorted(api.calls.items())))
+    clicks = len(stats.latency.get("button", []))
+    edits = api.calls.get("editMessageText", 0)
+    if edits:
+        print(f"clicks per message edit: {clicks / edits:.1f}")
+    if args.metrics:
+        print(metrics.render())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--events", type=int, default=1, help="events per chat")
+    parser.add_argument("--players", type=int, default=40, help="players clicking in each event")
+    parser.add_argument("--clicks", type=int, default=2, help="click rounds per player")
+    parser.add_argument("--window", type=float, default=0.2, help="re-render coalesce window, seconds")
+    parser.add_argument("--chat-interval", type=float, default=0.5, help="minimal interval between edits in chat")
+    parser.add_argument("--commit-delay", type=float, default=0.05, help="database group commit window")
+    parser.add_argument("--metrics", action="store_true", help="print built-in metrics in Prometheus format")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
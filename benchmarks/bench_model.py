@@ -0,0 +1,116 @@
+"""
+Benchmark of event model hydration: 10k events and 100k members loaded from SQLite
+Compares slotted Event.from_rows() with the old path (full constructor, then fields overwritten and
+time converted eagerly), and roster loading with one query per chat against one query per event.
+Reports time and memory allocated per loaded object.
+
+Run: python benchmarks/bench_model.py [--events 10000] [--members 100000]
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from database import FootballBotDatabase
+from event import Event
+
+CHAT_ID = -1000
+
+
+async def fill(db, events, members):
+    start = time.time() + 86400
+    ids = await db.create_events([(f"Футбол {i}", start + i * 3600, "Поле", start - 86400, i + 1, CHAT_ID, 21)
+                                  for i in range(events)])
+    connection = await db._get_db()
+    per_event = max(1, members // events)
+    await connection.executemany(
+        "insert into event_member(event_id, user_id, name, username, join_timestamp, state, count) "
+        "values(?, ?, ?, ?, ?, ?, ?)",
+        [(ids[i // per_event], i % per_event, f"Гравець {i}", f"player{i}", start + i, 1 + i % 2, 1)
+         for i in range(events * per_event)]
+    )
+    await connection.commit()
+
+
+def legacy_from_row(row):
+    """Event construction used before slotted model: constructor with parsing, then fields overwritten"""
+    item = Event(message_text="", db_id=int(row[0]))
+    item.title = str(row[1])
+    item.time = datetime.datetime.fromtimestamp(int(row[2]))
+    item.address = str(row[3])
+    item.message_time = row[4]
+    item.message_id = row[5]
+    item.chat_id = row[6]
+    item.players_limit = int(row[7])
+    return item
+
+
+def measure(name, count, func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<40} {elapsed * 1000:9.2f} ms {elapsed / count * 1e6:8.2f} us/obj {peak / count:8.0f} B/obj")
+    return result
+
+
+async def measure_async(name, count, coroutine_function):
+    start = time.perf_counter()
+    await coroutine_function()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<40} {elapsed * 1000:9.2f} ms {elapsed / count * 1e6:8.2f} us/obj")
+
+
+async def run(args):
+    work_dir = tempfile.mkdtemp(prefix="kt_football_model_")
+    db = FootballBotDatabase.instance(os.path.join(work_dir, "model.db"))
+    try:
+        await fill(db, args.events, args.members)
+        event_rows = await db.get_upcoming_events(CHAT_ID)
+        member_rows = await db.get_chat_members(CHAT_ID)
+        print(f"{len(event_rows)} events, {len(member_rows)} members")
+
+        measure("events: constructor + overwrite (old)", len(event_rows),
+                lambda: [legacy_from_row(row) for row in event_rows])
+        events = measure("events: Event.from_rows", len(event_rows), lambda: Event.from_rows(event_rows))
+        measure("events: first access of .time", len(events), lambda: [e.time for e in events])
+        measure("members: Player.from_row", len(member_rows),
+                lambda: [Event.Player.from_row(row) for row in member_rows])
+
+        async def per_event():
+            for item in events:
+                await item.load_players()
+
+        async def batch():
+            await Event.load_players_of_events(events, CHAT_ID)
+
+        async def chat_load():
+            await Event.load_players_of_events(await Event.event_list(CHAT_ID), CHAT_ID)
+
+        await measure_async("rosters: query per event", len(member_rows), per_event)
+        await measure_async("rosters: one query per chat", len(member_rows), batch)
+        await measure_async("chat: events + rosters from database", len(member_rows), chat_load)
+    finally:
+        await db.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--members", type=int, default=100000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Cold-start benchmark of KT Football bot: how long a fresh process needs before it answers
+Measures import of bot modules, schema migration of new database, upgrade of database
+created before versioned schema, open of up-to-date database and the first query after open.
+
+Run: python benchmarks/bench_startup.py [--events 20000] [--runs 5]
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from database import FootballBotDatabase
+
+
+def measure_import() -> float:
+    code = "import time; t = time.perf_counter(); import kt_football_bot; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip())
+
+
+def create_unversioned(path, events):
+    """Database as created before versioned schema: initial tables, user_version 0"""
+    db = sqlite3.connect(path)
+    for sql in FootballBotDatabase.MIGRATIONS[0]:
+        db.execute(sql)
+    db.executemany(FootballBotDatabase.SQL_INSERT_EVENT,
+                   [(f"Футбол {i}", 1700000000.0 + i * 3600, "Поле", 1700000000.0, i + 1, -1000 - i % 100, 21)
+                    for i in range(events)])
+    db.executemany("insert into event_member(event_id, user_id, name, username, join_timestamp) values(?, ?, ?, ?, ?)",
+                   [(i // 10 + 1, i % 10, f"Гравець {i}", "", 1700000000.0 + i) for i in range(events * 10)])
+    db.commit()
+    db.close()
+
+
+async def open_db(path) -> tuple:
+    """:return: (open + migrate seconds, first query seconds)"""
+    FootballBotDatabase.global_instance = None
+    db = FootballBotDatabase.instance(path)
+    start = time.perf_counter()
+    await db.migrate()
+    opened = time.perf_counter() - start
+    start = time.perf_counter()
+    await db.get_upcoming_events(-1000, since=0)
+    first_query = time.perf_counter() - start
+    await db.close()
+    return opened, first_query
+
+
+async def run(args):
+    results = {}
+
+    def add(name, value):
+        results.setdefault(name, []).append(value)
+
+    for _ in range(args.runs):
+        add("import bot modules", measure_import())
+        work_dir = tempfile.mkdtemp(prefix="kt_football_startup_")
+        try:
+            new_path = os.path.join(work_dir, "new.db")
+            opened, first_query = await open_db(new_path)
+            add("new database: migrate", opened)
+            opened, first_query = await open_db(new_path)
+            add("up-to-date: open", opened)
+            add("up-to-date: first query", first_query)
+
+            old_path = os.path.join(work_dir, "old.db")
+            create_unversioned(old_path, args.events)
+            opened, first_query = await open_db(old_path)
+            add(f"upgrade {args.events} events", opened)
+            opened, first_query = await open_db(old_path)
+            add("upgraded: open", opened)
+            add("upgraded: first query", first_query)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"schema version {len(FootballBotDatabase.MIGRATIONS)}, {args.runs} runs")
+    for name, values in results.items():
+        print(f"{name:<28} median={statistics.median(values) * 1000:9.2f} ms  max={max(values) * 1000:9.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=20000, help="events in database created before versioning")
+    parser.add_argument("--runs", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Regression check of FootballBotDatabase.add_member: click order of concurrent callbacks,
+positions in roster and queue, repeated join, leave, toggle and ban
+Exits with non-zero status if any check fails.
+
+Run: python benchmarks/check_members.py [--clicks 100]
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from database import FootballBotDatabase
+
+CHAT_ID = -1000
+PLAYERS_LIMIT = 21
+
+failures = []
+
+
+def check(condition: bool, message: str):
+    if not condition:
+        failures.append(message)
+        print(f"FAIL {message}")
+
+
+async def run(args):
+    work_dir = tempfile.mkdtemp(prefix="kt_football_members_")
+    # group commit: clicks share transactions as in production
+    db = FootballBotDatabase.instance(os.path.join(work_dir, "members.db"), 0.05)
+    try:
+        event_id = await db.create_event("Гра", time.time() + 86400, "Поле", time.time(), 0, CHAT_ID, PLAYERS_LIMIT)
+
+        # concurrent callbacks: roster order is the order of clicks
+        start = time.perf_counter()
+        results = await asyncio.gather(*[
+            db.add_member(event_id, user_id, f"Гравець {user_id}", f"player{user_id}")
+            for user_id in range(args.clicks)
+        ])
+        elapsed = time.perf_counter() - start
+        check([r.position for r in results] == list(range(1, args.clicks + 1)),
+              f"positions of concurrent joins: {[r.position for r in results]}")
+        check(all(r.in_queue == (r.position > PLAYERS_LIMIT) for r in results), "queue flag of concurrent joins")
+        timestamps = [r.join_timestamp for r in results]
+        check(timestamps == sorted(set(timestamps)), "join timestamps are strictly increasing")
+        rows = await db.get_member_list(event_id)
+        check([row[2] for row in rows] == list(range(args.clicks)), "stored roster order")
+
+        # repeated join keeps place and counts clicks
+        again = await db.add_member(event_id, 0, "Гравець 0", "player0")
+        check(again.state == FootballBotDatabase.STATE_JOINED and again.position == 1 and again.count == 2,
+              f"repeated join: {again}")
+
+        # leave, then join again: player goes to the end of roster
+        left = await db.add_member(event_id, 1, "Гравець 1", "player1", FootballBotDatabase.STATE_NOT_GOING)
+        check(left.state == FootballBotDatabase.STATE_NOT_GOING and left.position is None, f"leave: {left}")
+        back = await db.add_member(event_id, 1, "Гравець 1", "player1")
+        check(back.position == args.clicks and back.in_queue == (args.clicks > PLAYERS_LIMIT), f"rejoin: {back}")
+
+        # toggle switches joined <-> not going
+        off = await db.add_member(event_id, 2, "Гравець 2", "player2", FootballBotDatabase.STATE_TOGGLE)
+        on = await db.add_member(event_id, 2, "Гравець 2", "player2", FootballBotDatabase.STATE_TOGGLE)
+        check(off.state == FootballBotDatabase.STATE_NOT_GOING and off.position is None, f"toggle off: {off}")
+        check(on.state == FootballBotDatabase.STATE_JOINED and on.position == args.clicks, f"toggle on: {on}")
+
+        # leave before join: member is stored as not going without clicks
+        first = await db.add_member(event_id, args.clicks + 1, "Новий", "", FootballBotDatabase.STATE_NOT_GOING)
+        check(first.state == FootballBotDatabase.STATE_NOT_GOING and first.count == 0 and first.position is None,
+              f"leave first: {first}")
+
+        # banned member is never changed by clicks
+        await db.add_ban(CHAT_ID, 3)
+        banned = await db.add_member(event_id, 3, "Гравець 3", "player3")
+        check(banned.state == FootballBotDatabase.STATE_BANNED and banned.position is None, f"banned join: {banned}")
+    finally:
+        await db.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"{args.clicks} concurrent joins in {elapsed * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clicks", type=int, default=100)
+    asyncio.run(run(parser.parse_args()))
+    print(f"checks: {'FAILED ' + str(len(failures)) if failures else 'all passed'}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Regression check of versioned schema migrations (FootballBotDatabase.MIGRATIONS):
+new database, database created before versioned schema and database of every intermediate version
+end with the same schema and version; data is kept; failed migration is rolled back.
+Exits with non-zero status if any check fails.
+
+Run: python benchmarks/check_migrations.py
+"""
+
+import asyncio
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from database import FootballBotDatabase
+
+failures = []
+
+
+def check(condition: bool, message: str):
+    if not condition:
+        failures.append(message)
+        print(f"FAIL {message}")
+
+
+def schema(path) -> tuple:
+    """:return: (user_version, set of (type, name, sql) of schema objects)"""
+    db = sqlite3.connect(path)
+    try:
+        version = db.execute("pragma user_version").fetchone()[0]
+        objects = {row for row in db.execute("select type, name, sql from sqlite_master")
+                   if not row[1].startswith("sqlite_")}
+    finally:
+        db.close()
+    return version, objects
+
+
+def create_at_version(path, version):
+    """Database migrated to given version by older code; one event with member"""
+    db = sqlite3.connect(path)
+    for migration in FootballBotDatabase.MIGRATIONS[:version]:
+        for sql in migration:
+            db.execute(sql)
+    db.execute(FootballBotDatabase.SQL_INSERT_EVENT, ("Гра", 1700000000.0, "Поле", 1699990000.0, 5, -1000, 21))
+    db.execute("insert into event_member(event_id, user_id, name, username, join_timestamp) values(1, 7, 'Гравець', '', 1)")
+    db.execute(f"pragma user_version={version if version > 1 else 0}")
+    db.commit()
+    db.close()
+
+
+async def migrate(path, db_class=FootballBotDatabase):
+    db = db_class(path, 0)
+    try:
+        await db.migrate()
+    finally:
+        await db.close()
+
+
+class BrokenMigration(FootballBotDatabase):
+    # the second statement fails: the first one has to be rolled back
+    MIGRATIONS = FootballBotDatabase.MIGRATIONS + [["create table broken(x)", "create table broken(x)"]]
+
+
+async def run(work_dir):
+    latest = len(FootballBotDatabase.MIGRATIONS)
+    new_path = os.path.join(work_dir, "new.db")
+    await migrate(new_path)
+    version, expected = schema(new_path)
+    check(version == latest, f"new database version {version} != {latest}")
+
+    # reopen of up-to-date database changes nothing
+    await migrate(new_path)
+    check(schema(new_path) == (latest, expected), "reopen of up-to-date database changed schema")
+
+    # version 1 is also the schema created before versioning (user_version 0)
+    for start in range(1, latest):
+        path = os.path.join(work_dir, f"v{start}.db")
+        create_at_version(path, start)
+        await migrate(path)
+        version, objects = schema(path)
+        check(version == latest, f"upgrade from {start}: version {version} != {latest}")
+        check(objects == expected, f"upgrade from {start}: schema differs: {sorted(objects ^ expected)}")
+        db = sqlite3.connect(path)
+        rows = db.execute("select e.event_title, m.user_id from event e join event_member m on m.event_id=e.id").fetchall()
+        db.close()
+        check(rows == [("Гра", 7)], f"upgrade from {start}: data lost: {rows}")
+
+    broken_path = os.path.join(work_dir, "broken.db")
+    await migrate(broken_path)
+    try:
+        await migrate(broken_path, BrokenMigration)
+        check(False, "failed migration did not raise")
+    except sqlite3.Error:
+        pass
+    version, objects = schema(broken_path)
+    check(version == latest, f"failed migration changed version to {version}")
+    check(objects == expected, "failed migration left schema changes")
+    print(f"schema version {latest}: upgrades from {latest - 1} older versions checked")
+
+
+def main():
+    work_dir = tempfile.mkdtemp(prefix="kt_football_migrations_")
+    try:
+        asyncio.run(run(work_dir))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"checks: {'FAILED ' + str(len(failures)) if failures else 'all passed'}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
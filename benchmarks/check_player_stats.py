@@ -0,0 +1,143 @@
+"""
+Regression check of player statistics (/kt_stats): totals of get_player_stats() match counting
+of raw rosters in Python before summarizing, after partial and full summarizing, after archival of events,
+and after the chat is moved to another database with older, newer or no summary watermark.
+Exits with non-zero status if any check fails.
+
+Run: python benchmarks/check_player_stats.py [--events 300]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from database import FootballBotDatabase
+
+CHATS = (-1000, -1001)
+PLAYERS_LIMIT = 5
+
+failures = []
+
+
+def check(condition: bool, message: str):
+    if not condition:
+        failures.append(message)
+        print(f"FAIL {message}")
+
+
+async def fill(db, events, now, chats=CHATS) -> dict:
+    """
+    Past events with random rosters, two events a day
+    :return: (chat_id, user_id) -> [games, queued, no_shows, reaction sum, reaction count] counted in Python
+    """
+    random.seed(1)
+    connection = await db._get_db()
+    expected = {}
+    for i in range(events):
+        chat_id = chats[i % len(chats)]
+        event_time = now - (i + 1) * 43200
+        message_time = event_time - 86400
+        event_id = (await db.create_events([("Гра", event_time, "Поле", message_time, 1, chat_id, PLAYERS_LIMIT)]))[0]
+        members = []
+        for user_id in random.sample(range(20), 10):
+            state = random.choice((1, 1, 2, 3))
+            count = random.choice((0, 1, 2)) if state == 2 else 1
+            members.append((user_id, state, count, message_time + random.random() * 1000))
+        await connection.executemany(
+            "insert into event_member(event_id, user_id, name, username, join_timestamp, state, count) "
+            "values(?, ?, ?, ?, ?, ?, ?)",
+            [(event_id, user_id, f"Гравець {user_id}", "", ts, state, count) for user_id, state, count, ts in members]
+        )
+        joined = sorted((m for m in members if m[1] == 1), key=lambda m: m[3])
+        for place, (user_id, _, _, ts) in enumerate(joined):
+            totals = expected.setdefault((chat_id, user_id), [0, 0, 0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += place >= PLAYERS_LIMIT
+            totals[3] += ts - message_time
+            totals[4] += 1
+        for user_id, state, count, _ in members:
+            if state == 2 and count > 0:
+                expected.setdefault((chat_id, user_id), [0, 0, 0, 0.0, 0])[2] += 1
+    await connection.commit()
+    return {key: (games, queued, no_shows, round(total / count, 6) if count else None)
+            for key, (games, queued, no_shows, total, count) in expected.items()}
+
+
+def totals(rows, chat_id=None) -> dict:
+    return {(row[0], row[1]): (row[4], row[5], row[6], None if row[7] is None else round(row[7], 6))
+            for row in rows if chat_id is None or row[0] == chat_id}
+
+
+async def check_stats(db, expected, stage):
+    got = totals(await db.get_player_stats())
+    check(got == expected, f"{stage}: {len(set(got.items()) ^ set(expected.items()))} players differ")
+
+
+async def run(args, work_dir):
+    now = time.time()
+    db = FootballBotDatabase(os.path.join(work_dir, "stats.db"), 0.05, os.path.join(work_dir, "archive.db"))
+    expected = await fill(db, args.events, now)
+    await check_stats(db, expected, "not summarized")
+    await db.summarize_stats(now, batch_size=args.events // 3)
+    await check_stats(db, expected, "partially summarized")
+    while not await db.summarize_stats(now):
+        pass
+    await check_stats(db, expected, "summarized")
+    start = time.perf_counter()
+    await db.get_player_stats(CHATS[0], 20)
+    print(f"stats of chat from {args.events} events: {(time.perf_counter() - start) * 1000:.2f} ms")
+    # archived events are counted by summary only
+    while await db.archive_events(now - 30 * 86400, 1000):
+        pass
+    await check_stats(db, expected, "archived")
+    await db.close()
+
+    # chat move: watermark of target is older, newer or not set
+    chat_id = CHATS[0]
+    chat_expected = {key: value for key, value in expected.items() if key[0] == chat_id}
+    cases = (("older target", now - 40 * 86400, now - 10 * 86400),
+             ("newer target", now - 10 * 86400, now - 40 * 86400),
+             ("target never summarized", now - 5 * 86400, None))
+    for index, (name, source_until, target_until) in enumerate(cases):
+        source = FootballBotDatabase(os.path.join(work_dir, f"source{index}.db"), 0.05)
+        target = FootballBotDatabase(os.path.join(work_dir, f"target{index}.db"), 0.05)
+        await fill(source, args.events, now)
+        # other chats of target are summarized by its own watermark
+        await fill(target, args.events, now, chats=(-2000, -2001))
+        await source.summarize_stats(source_until, batch_size=args.events * 2)
+        if target_until is not None:
+            await target.summarize_stats(target_until, batch_size=args.events * 2)
+        await target.import_chat(await source.export_chat(chat_id))
+        got = totals(await target.get_player_stats(chat_id))
+        check(got == chat_expected, f"move to {name}: {len(set(got.items()) ^ set(chat_expected.items()))} players differ")
+        while not await target.summarize_stats(now):
+            pass
+        got = totals(await target.get_player_stats(chat_id))
+        check(got == chat_expected, f"move to {name}, summarized: "
+                                    f"{len(set(got.items()) ^ set(chat_expected.items()))} players differ")
+        await source.close()
+        await target.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=300)
+    args = parser.parse_args()
+    work_dir = tempfile.mkdtemp(prefix="kt_football_stats_")
+    try:
+        asyncio.run(run(args, work_dir))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"checks: {'FAILED ' + str(len(failures)) if failures else 'all passed'}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
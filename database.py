@@ -25,96 +25,366 @@ Creates and supports tables in database:
       - Chat id
       - User id
       -
+    - event_job
+    Scheduled actions of events (publishing of message, reminder, closing of roster):
+      - Event id
+      - kind of action
+      - due timestamp
+      - done - 1 when action was started; action is never started twice
+    - event_template
+    Per-chat defaults of new events:
+      - Chat id
+      - name of template
+      - parameters in format of /kt_add_event command
+    - processed_update
+    Keys of recently processed Telegram updates ("u<update_id>", "q<callback query id>") with timestamps
+    - player_stats
+    Attendance of player in chat, summed over events finished before stats_state "summarized_until":
+      - games - joined at event start (main list or queue); queued - in queue at event start
+      - no_shows - joined and then left the event
+      - reaction_sum, reaction_count - seconds between event message and joining
+    Finished events with their members are moved to tables event and event_member of archive
+    database (separate file attached as "archive"), see archive_events()
 """
+import asyncio
+import os
+import time
+from collections import namedtuple
+
 import aiosqlite
 import logging
 
+import metrics
+
 logger = logging.getLogger(__name__)
 
+# Result of join/leave operation: new state of member and its place in event roster.
+# position is 1-based place among joined players (None if not joined);
+# in_queue is True if player is beyond players limit
+MemberUpdate = namedtuple("MemberUpdate", ["state", "join_timestamp", "count", "position", "in_queue"])
+
 
 class FootballBotDatabase:
 
     #global instance
     global_instance = None
 
-    SQL_CREATE_DB = [
-        (
-            "create table if not exists "
-            "event(id INTEGER PRIMARY KEY AUTOINCREMENT, "
-            "event_title TEXT, "
-            "event_time REAL, "
-            "event_address TEXT, "
-            "message_timestamp REAL, "
-            "message_id INTEGER(8) NOT NULL, "
-            "chat_id INTEGER(8) NOT NULL, "
-            "players_limit INTEGER(4) DEFAULT 21)"
-        ),
-        (
-            "create table if not exists "
-            "event_member(id INTEGER PRIMARY KEY AUTOINCREMENT, "
-            "event_id INTEGER NOT NULL, "
-            "user_id INTEGER(8) NOT NULL, "
-            "name text, "
-            "username text, "
-            "join_timestamp REAL,"
-            "state INTEGER default 1,"
-            "count INTEGER default 1)"
-        ),
-        (
-            "create table if not exists "
-            "ban(id INTEGER PRIMARY KEY AUTOINCREMENT, "
-            "chat_id INTEGER NOT NULL, "
-            "user_id INTEGER(8) NOT NULL, "
-            "end_timestamp REAL)"
-        ),
-        "create index if not exists event_event_time_idx on event(event_time)",
-        "create index if not exists event_event_time_chat on event(chat_id)",
-        "create unique index if not exists member_event_filter on event_member(event_id, user_id)",
-        "create index if not exists member_event_time_order on event_member(event_id, user_id, join_timestamp)",
-        "create index if not exists ban_user on ban(chat_id, user_id)",
+    # event_member.state values
+    STATE_JOINED = 1
+    STATE_NOT_GOING = 2
+    STATE_BANNED = 3
+    # pseudo-state for add_member(): switch joined <-> not going
+    STATE_TOGGLE = 0
+
+    # Versioned schema: MIGRATIONS[n] upgrades database from version n to n + 1 (PRAGMA user_version).
+    # Schema is changed only by appending new migration; applied migrations are never edited.
+    MIGRATIONS = [
+        # 1: initial schema; "if not exists" adopts databases created before versioning
+        [
+            (
+                "create table if not exists "
+                "event(id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "event_title TEXT, "
+                "event_time REAL, "
+                "event_address TEXT, "
+                "message_timestamp REAL, "
+                "message_id INTEGER(8) NOT NULL, "
+                "chat_id INTEGER(8) NOT NULL, "
+                "players_limit INTEGER(4) DEFAULT 21)"
+            ),
+            (
+                "create table if not exists "
+                "event_member(id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "event_id INTEGER NOT NULL, "
+                "user_id INTEGER(8) NOT NULL, "
+                "name text, "
+                "username text, "
+                "join_timestamp REAL,"
+                "state INTEGER default 1,"
+                "count INTEGER default 1)"
+            ),
+            (
+                "create table if not exists "
+                "ban(id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "chat_id INTEGER NOT NULL, "
+                "user_id INTEGER(8) NOT NULL, "
+                "end_timestamp REAL)"
+            ),
+            "create index if not exists event_event_time_idx on event(event_time)",
+            "create index if not exists event_event_time_chat on event(chat_id)",
+            "create unique index if not exists member_event_filter on event_member(event_id, user_id)",
+            "create index if not exists member_event_time_order on event_member(event_id, user_id, join_timestamp)",
+            "create index if not exists ban_user on ban(chat_id, user_id)",
+        ],
+        # 2: indexes of chat events by time, roster of event
+        [
+            "create index if not exists event_chat_time on event(chat_id, event_time)",
+            "create index if not exists member_event_roster on event_member(event_id, state, join_timestamp)",
+        ],
+        # 3: scheduled actions of events
+        [
+            (
+                "create table if not exists "
+                "event_job(id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "event_id INTEGER NOT NULL, "
+                "kind TEXT NOT NULL, "
+                "due REAL NOT NULL, "
+                "done INTEGER default 0)"
+            ),
+            "create unique index if not exists job_event_kind on event_job(event_id, kind)",
+            "create index if not exists job_pending on event_job(done, due)",
+        ],
+        # 4: (chat_id) index is prefix of event_chat_time
+        [
+            "drop index if exists event_event_time_chat",
+        ],
+        # 5: per-chat templates of events
+        [
+            (
+                "create table if not exists "
+                "event_template(id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "chat_id INTEGER(8) NOT NULL, "
+                "name TEXT NOT NULL, "
+                "params TEXT NOT NULL)"
+            ),
+            "create unique index if not exists template_chat_name on event_template(chat_id, name)",
+        ],
+        # 6: keys of processed Telegram updates
+        [
+            (
+                "create table if not exists "
+                "processed_update(key TEXT PRIMARY KEY, "
+                "timestamp REAL NOT NULL) without rowid"
+            ),
+            "create index if not exists processed_update_time on processed_update(timestamp)",
+        ],
+        # 7: attendance statistics of players, summarized from finished events
+        [
+            (
+                "create table if not exists "
+                "player_stats(id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "chat_id INTEGER(8) NOT NULL, "
+                "user_id INTEGER(8) NOT NULL, "
+                "name text, "
+                "username text, "
+                "games INTEGER default 0, "
+                "queued INTEGER default 0, "
+                "no_shows INTEGER default 0, "
+                "reaction_sum REAL default 0, "
+                "reaction_count INTEGER default 0, "
+                "last_event_time REAL)"
+            ),
+            "create unique index if not exists player_stats_user on player_stats(chat_id, user_id)",
+            "create table if not exists stats_state(name TEXT PRIMARY KEY, value REAL)",
+        ],
     ]
 
-    def __init__(self, file_name="kt_football.db"):
+    # schema of archive database: the same columns as live tables, ids are kept
+    ARCHIVE_MIGRATIONS = [
+        [
+            (
+                "create table if not exists "
+                "archive.event(id INTEGER PRIMARY KEY, "
+                "event_title TEXT, "
+                "event_time REAL, "
+                "event_address TEXT, "
+                "message_timestamp REAL, "
+                "message_id INTEGER(8) NOT NULL, "
+                "chat_id INTEGER(8) NOT NULL, "
+                "players_limit INTEGER(4) DEFAULT 21)"
+            ),
+            (
+                "create table if not exists "
+                "archive.event_member(id INTEGER PRIMARY KEY, "
+                "event_id INTEGER NOT NULL, "
+                "user_id INTEGER(8) NOT NULL, "
+                "name text, "
+                "username text, "
+                "join_timestamp REAL,"
+                "state INTEGER default 1,"
+                "count INTEGER default 1)"
+            ),
+            "create index if not exists archive.archive_event_chat_time on event(chat_id, event_time)",
+            "create index if not exists archive.archive_member_event on event_member(event_id)",
+            "create index if not exists archive.archive_member_user on event_member(user_id)",
+        ],
+    ]
+
+    # size of prepared statements cache of connection
+    STATEMENT_CACHE_SIZE = 256
+
+    def __init__(self, file_name="kt_football.db", commit_delay=0.0, archive_file=None):
+        """
+        :param file_name: SQLite database file
+        :param commit_delay: persistence mode. 0 - every write is committed immediately;
+            > 0 - write-behind: writes are grouped and committed once per commit_delay seconds.
+            In write-behind mode a crash loses at most last commit_delay seconds of writes;
+            flush() or close() (called on bot stop) commits everything pending
+        :param archive_file: SQLite file for finished events, by default "<file_name>.archive"
+        """
         self.__db_file_name = file_name
+        if archive_file is None:
+            root, ext = os.path.splitext(file_name)
+            archive_file = f"{root}.archive{ext}"
+        self.__archive_file_name = archive_file
         self.__db = None
+        self.__commit_delay = float(commit_delay)
+        self.__commit_task = None
+        # serializes write transactions of concurrent callbacks and group commit
+        self.__write_lock = asyncio.Lock()
+        # join timestamps are strictly increasing: keeps click order for clicks within the same clock tick
+        self.__last_join_timestamp = 0.0
 
     async def _get_db(self) -> aiosqlite.Connection:
         if self.__db is None:
-            self.__db = await aiosqlite.connect(self.__db_file_name)
-            for sql in self.SQL_CREATE_DB:
-                try:
-                    logger.info(f"Execute SQL: {sql}")
-                    await self.__db.execute(sql)
-                except Exception as e:
-                    logger.error(e)
-                    logger.error(repr(e))
-                    raise
+            self.__db = await aiosqlite.connect(self.__db_file_name, cached_statements=self.STATEMENT_CACHE_SIZE)
+            # free pages are returned to file system by optimize(); takes effect only on a new database file,
+            # so it must precede journal_mode, which writes the file header
+            await self.__db.execute("pragma auto_vacuum=INCREMENTAL")
+            # WAL: readers do not block writer; commit appends to log, fsync only on checkpoint
+            await self.__db.execute("pragma journal_mode=WAL")
+            await self.__db.execute("pragma synchronous=NORMAL")
+            await self.__db.execute("attach database ? as archive", (self.__archive_file_name,))
+            await self.__db.execute("pragma archive.journal_mode=WAL")
+            # up-to-date database costs one pragma read per schema
+            await self.__migrate("main", self.MIGRATIONS)
+            await self.__migrate("archive", self.ARCHIVE_MIGRATIONS)
         return self.__db
 
+    async def __migrate(self, schema, migrations):
+        async with self.__db.execute(f"pragma {schema}.user_version") as cursor:
+            version = (await cursor.fetchone())[0]
+        if version >= len(migrations):
+            return
+        for index in range(version, len(migrations)):
+            # every migration with its version number is one transaction
+            await self.__db.execute("begin")
+            try:
+                for sql in migrations[index]:
+                    logger.debug(f"Execute SQL: {sql}")
+                    await self.__db.execute(sql)
+                await self.__db.execute(f"pragma {schema}.user_version={index + 1}")
+                await self.__db.commit()
+            except Exception as e:
+                await self.__db.rollback()
+                logger.error(f"Migration of {schema} database to version {index + 1} failed: {repr(e)}")
+                raise
+        logger.info(f"Database {schema} schema upgraded from version {version} to {len(migrations)}")
+
+    async def migrate(self):
+        """
+        Open database and bring its schema to current version.
+        Called before bot accepts updates, so the first request does not pay for schema upgrade.
+        Database created before incremental vacuum is switched to it here by one full vacuum:
+        it may take long on big file, but it never blocks handlers
+        """
+        db: aiosqlite.Connection = await self._get_db()
+        async with db.execute("pragma auto_vacuum") as cursor:
+            auto_vacuum = (await cursor.fetchone())[0]
+        if auto_vacuum != 2:
+            logger.info("Switch database to incremental vacuum")
+            async with self.__write_lock:
+                if db.in_transaction:
+                    await db.commit()
+                await db.execute("pragma auto_vacuum=INCREMENTAL")
+                await db.execute("vacuum main")
+
+    async def _write(self, sql, params) -> int:
+        """
+        Execute single write statement and commit it according to persistence mode
+        :return: rowid of last inserted row
+        """
+        db: aiosqlite.Connection = await self._get_db()
+        async with self.__write_lock:
+            async with db.execute(sql, params) as cursor:
+                rowid = cursor.lastrowid
+        await self._write_done()
+        return rowid
+
+    async def _write_done(self):
+        """Commit written data immediately or schedule group commit"""
+        if self.__commit_delay <= 0:
+            await self.flush()
+        elif self.__commit_task is None:
+            self.__commit_task = asyncio.get_running_loop().create_task(self.__group_commit())
+
+    async def __group_commit(self):
+        await asyncio.sleep(self.__commit_delay)
+        self.__commit_task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Group commit failed: {repr(e)}")
+
+    @metrics.timed(metrics.DB_SECONDS, method="flush")
+    async def flush(self):
+        """Commit all pending writes"""
+        if self.__db is None:
+            return
+        async with self.__write_lock:
+            if self.__db.in_transaction:
+                await self.__db.commit()
+
+    async def close(self):
+        """Commit pending writes and close database"""
+        if self.__commit_task is not None:
+            self.__commit_task.cancel()
+            self.__commit_task = None
+        if self.__db is not None:
+            await self.flush()
+            await self.__db.close()
+            self.__db = None
+
+    # SQL texts are constant: sqlite3 keeps prepared statements in per-connection cache
+    # and reuses them instead of parsing query again
+    SQL_INSERT_EVENT = (
+        "insert into event(event_title, event_time, event_address, message_timestamp, message_id, chat_id, players_limit) "
+        "values(?, ?, ?, ?, ?, ?, ?)"
+    )
+    SQL_SELECT_CHAT_EVENTS = "select * from event where chat_id=? and event_time>? order by event_time"
+    SQL_SELECT_EVENTS_IN_RANGE = "select * from event where chat_id=? and event_time>? and event_time<? order by event_time"
+    SQL_UPDATE_MESSAGE_ID = "update event set message_id=? where id=?"
+    SQL_SELECT_MEMBERS = "select * from event_member where event_id=? order by join_timestamp"
+    # update_event() key -> (column, type)
+    EVENT_UPDATE_COLUMNS = {"title": ("event_title", str),
+                            "time": ("event_time", float),
+                            "address": ("event_address", str),
+                            "players_limit": ("players_limit", int)}
+
+    @metrics.timed(metrics.DB_SECONDS, method="create_event")
     async def create_event(
         self, event_title, event_time, event_address, message_time, message_id, chat_id, players_limit=21
     ):
-        event_title = str(event_title).replace("'", "")
-        event_title = str(event_title).replace('"', "")
-        event_address = str(event_address).replace("'", "")
-        event_address = str(event_address).replace('"', "")
-        event_time = float(event_time)
-        message_time = float(message_time)
-        message_id = int(message_id)
-        chat_id = int(chat_id)
-        players_limit = int(players_limit)
-        db: aiosqlite.Connection = await self._get_db()
-
-        await db.execute(
-            f"insert into event(event_title, event_time, event_address, message_timestamp, message_id, chat_id, players_limit) "
-            f"values('{event_title}', '{event_time}', '{event_address}', '{message_time}', '{message_id}', '{chat_id}', '{players_limit}')"
+        params = (
+            str(event_title),
+            float(event_time),
+            str(event_address),
+            float(message_time),
+            int(message_id),
+            int(chat_id),
+            int(players_limit),
         )
-        cursor = await db.execute("select last_insert_rowid()")
-        rows = await cursor.fetchall()
-        primary_key = rows[0][0]
-        await db.commit()
-        return primary_key
+        return await self._write(self.SQL_INSERT_EVENT, params)
 
+    @metrics.timed(metrics.DB_SECONDS, method="create_events")
+    async def create_events(self, rows) -> list:
+        """
+        Create many events in one transaction
+        :param rows: list of (event_title, event_time, event_address, message_time, message_id, chat_id, players_limit)
+        :return: ids of created events
+        """
+        db: aiosqlite.Connection = await self._get_db()
+        ids = []
+        async with self.__write_lock:
+            for title, event_time, address, message_time, message_id, chat_id, players_limit in rows:
+                params = (str(title), float(event_time), str(address), float(message_time), int(message_id),
+                          int(chat_id), int(players_limit))
+                async with db.execute(self.SQL_INSERT_EVENT, params) as cursor:
+                    ids.append(cursor.lastrowid)
+        await self._write_done()
+        return ids
+
+    @metrics.timed(metrics.DB_SECONDS, method="update_event")
     async def update_event(self, event_id, event_descr):
         """
         Update event description in database
@@ -122,50 +392,643 @@ class FootballBotDatabase:
         :param event_descr: Dictionary of items to update. Possible update:
            'title', 'time', 'address', 'players_limit'
         """
-        allowed_keys = {"title": "event_title",
-                        "time": "event_time",
-                        "address": "event_address",
-                        "players_limit": "players_limit"}
-        sql = []
-        for key, db_key in allowed_keys.items():
+        columns = []
+        params = []
+        # columns are always in the same order: each subset of keys gives the same SQL text
+        for key, (db_key, value_type) in self.EVENT_UPDATE_COLUMNS.items():
             if key in event_descr:
-                s = str(event_descr[key]).replace("'", "").replace('"', "")
-                sql.append(f"{db_key}='{s}'")
-        event_id = int(event_id)
-        if len(sql) > 0:
-            sql = f"update event set {','.join(sql)} where id={event_id}"
-            db: aiosqlite.Connection = await self._get_db()
-            await db.execute(sql)
+                columns.append(f"{db_key}=?")
+                params.append(value_type(event_descr[key]))
+        if len(columns) > 0:
+            params.append(int(event_id))
+            await self._write(f"update event set {','.join(columns)} where id=?", params)
 
-    async def get_all_events(self, chat_id):
+    @metrics.timed(metrics.DB_SECONDS, method="get_upcoming_events")
+    async def get_upcoming_events(self, chat_id, since=None):
+        """
+        :param since: timestamp; by default now - only events which are not started yet
+        :return: events of chat with event_time > since ordered by event time
+        """
+        since = time.time() if since is None else float(since)
         db: aiosqlite.Connection = await self._get_db()
-        chat_id = int(chat_id)
-        async with db.execute(f"select * from event where chat_id={chat_id} order by event_time") as cursor:
+        async with db.execute(self.SQL_SELECT_CHAT_EVENTS, (int(chat_id), since)) as cursor:
             rows = await cursor.fetchall()
         return rows
 
-    async def add_member(self):
+    @metrics.timed(metrics.DB_SECONDS, method="get_events_in_range")
+    async def get_events_in_range(self, chat_id, start_time, end_time):
+        """
+        :return: events of chat with start_time < event_time < end_time
+        """
         db: aiosqlite.Connection = await self._get_db()
-        # todo: add member to event
+        async with db.execute(self.SQL_SELECT_EVENTS_IN_RANGE, (int(chat_id), float(start_time), float(end_time))) as cursor:
+            rows = await cursor.fetchall()
+        return rows
 
-    async def update_message_id_for_event(self, event_id, msg_id):
+    # new state of existing member: banned member is never changed, toggle switches 1 <-> 2
+    __NEW_MEMBER_STATE = "case when state=3 then 3 when :state=0 then 3-state else :state end"
+    SQL_UPSERT_MEMBER = (
+        "insert into event_member(event_id, user_id, name, username, join_timestamp, state, count) "
+        "values(:event_id, :user_id, :name, :username, :ts, "
+        "case :state when 2 then 2 else 1 end, case :state when 2 then 0 else 1 end) "
+        "on conflict(event_id, user_id) do update set "
+        "name=excluded.name, "
+        "username=excluded.username, "
+        f"join_timestamp=case when {__NEW_MEMBER_STATE}=1 and state<>1 then :ts else join_timestamp end, "
+        f"count=count + case when {__NEW_MEMBER_STATE}=1 then 1 else 0 end, "
+        f"state={__NEW_MEMBER_STATE} "
+        "returning state, join_timestamp, count"
+    )
+    SQL_MEMBER_POSITION = (
+        "select count(*), (select players_limit from event where id=:event_id) from event_member "
+        "where event_id=:event_id and state=1 and join_timestamp<=:ts"
+    )
+
+    @metrics.timed(metrics.DB_SECONDS, method="add_member")
+    async def add_member(self, event_id, user_id, name, username, state=STATE_JOINED) -> MemberUpdate:
+        """
+        Join/leave event in single transaction
+        :param event_id: Event identifier in database
+        :param user_id: Telegram user id
+        :param name: user visible name
+        :param username: Telegram nick (could be empty)
+        :param state: STATE_JOINED, STATE_NOT_GOING or STATE_TOGGLE; banned member stays banned
+        :return: MemberUpdate with new state and position of member in roster
+        """
         event_id = int(event_id)
-        msg_id = int(msg_id)
+        user_id = int(user_id)
+        state = int(state)
+        db: aiosqlite.Connection = await self._get_db()
+        async with self.__write_lock:
+            ts = max(time.time(), self.__last_join_timestamp + 1e-6)
+            params = {"event_id": event_id, "user_id": user_id, "name": str(name),
+                      "username": str(username or ""), "ts": ts, "state": state}
+            # savepoint keeps operation atomic inside of group commit transaction
+            if not db.in_transaction:
+                await db.execute("begin")
+            await db.execute("savepoint add_member")
+            try:
+                async with db.execute(self.SQL_UPSERT_MEMBER, params) as cursor:
+                    new_state, join_timestamp, count = await cursor.fetchone()
+                position = None
+                in_queue = False
+                if new_state == self.STATE_JOINED:
+                    params["ts"] = join_timestamp
+                    async with db.execute(self.SQL_MEMBER_POSITION, params) as cursor:
+                        position, players_limit = await cursor.fetchone()
+                    in_queue = players_limit is not None and position > int(players_limit)
+                await db.execute("release add_member")
+            except Exception:
+                await db.execute("rollback to add_member")
+                await db.execute("release add_member")
+                raise
+            self.__last_join_timestamp = ts
+        await self._write_done()
+        return MemberUpdate(new_state, join_timestamp, count, position, in_queue)
+
+    @metrics.timed(metrics.DB_SECONDS, method="update_message_id_for_event")
+    async def update_message_id_for_event(self, event_id, msg_id):
+        await self._write(self.SQL_UPDATE_MESSAGE_ID, (int(msg_id), int(event_id)))
+
+    SQL_SELECT_CHAT_MEMBERS = (
+        "select event_member.* from event join event_member on event_member.event_id=event.id "
+        "where event.chat_id=? and event.event_time>?"
+    )
+
+    @metrics.timed(metrics.DB_SECONDS, method="get_chat_members")
+    async def get_chat_members(self, chat_id, since=None):
+        """
+        Members of all events returned by get_upcoming_events(chat_id, since), in no particular order
+        """
+        since = time.time() if since is None else float(since)
         db: aiosqlite.Connection = await self._get_db()
-        await db.execute(f"update event set message_id={msg_id} where id={event_id}")
+        async with db.execute(self.SQL_SELECT_CHAT_MEMBERS, (int(chat_id), since)) as cursor:
+            rows = await cursor.fetchall()
+        return rows
 
+    @metrics.timed(metrics.DB_SECONDS, method="get_member_list")
     async def get_member_list(self, event_id):
         db: aiosqlite.Connection = await self._get_db()
-        event_id = int(event_id)
-        async with db.execute(f"select * from event_member where event_id={event_id} order by join_timestamp") as cursor:
+        async with db.execute(self.SQL_SELECT_MEMBERS, (int(event_id),)) as cursor:
+            rows = await cursor.fetchall()
+        return rows
+
+    SQL_SELECT_ACTIVE_BANS = "select chat_id, user_id, end_timestamp from ban where end_timestamp is null or end_timestamp>?"
+    SQL_SELECT_CHAT_BANS = (
+        "select chat_id, user_id, end_timestamp from ban where chat_id=? and (end_timestamp is null or end_timestamp>?)"
+    )
+    SQL_SELECT_EXPIRED_BANS = "select chat_id, user_id from ban where end_timestamp is not null and end_timestamp<=?"
+    SQL_DELETE_BAN = "delete from ban where chat_id=? and user_id=?"
+    # ban renewed after it was selected as expired is not removed
+    SQL_DELETE_EXPIRED_BAN = "delete from ban where chat_id=? and user_id=? and end_timestamp<=?"
+    SQL_INSERT_BAN = "insert into ban(chat_id, user_id, end_timestamp) values(?, ?, ?)"
+    # state of user in events of chat which are not started yet
+    SQL_UPDATE_UPCOMING_MEMBER_STATE = (
+        "update event_member set state=:new_state where user_id=:user_id and state=:state "
+        "and event_id in (select id from event where chat_id=:chat_id and event_time>:now)"
+    )
+    SQL_FIND_CHAT_USER = (
+        "select user_id, name from event_member where username=? "
+        "and event_id in (select id from event where chat_id=?) order by join_timestamp desc limit 1"
+    )
+
+    @metrics.timed(metrics.DB_SECONDS, method="get_active_bans")
+    async def get_active_bans(self, now, chat_id=None):
+        """
+        :param chat_id: chat of bans, None for all chats
+        :return: bans which are not expired at `now`: list of (chat_id, user_id, end_timestamp or None)
+        """
+        db: aiosqlite.Connection = await self._get_db()
+        if chat_id is None:
+            cursor = await db.execute(self.SQL_SELECT_ACTIVE_BANS, (float(now),))
+        else:
+            cursor = await db.execute(self.SQL_SELECT_CHAT_BANS, (int(chat_id), float(now)))
+        async with cursor:
+            rows = await cursor.fetchall()
+        return rows
+
+    @metrics.timed(metrics.DB_SECONDS, method="add_ban")
+    async def add_ban(self, chat_id, user_id, end_timestamp=None):
+        """
+        Ban user in chat until end_timestamp (None - permanently); replaces previous ban of user.
+        User is removed from rosters of events which are not started yet
+        """
+        chat_id = int(chat_id)
+        user_id = int(user_id)
+        db: aiosqlite.Connection = await self._get_db()
+        async with self.__write_lock:
+            await db.execute(self.SQL_DELETE_BAN, (chat_id, user_id))
+            await db.execute(self.SQL_INSERT_BAN,
+                             (chat_id, user_id, None if end_timestamp is None else float(end_timestamp)))
+            for state in (self.STATE_JOINED, self.STATE_NOT_GOING):
+                await db.execute(self.SQL_UPDATE_UPCOMING_MEMBER_STATE,
+                                 {"new_state": self.STATE_BANNED, "state": state, "user_id": user_id,
+                                  "chat_id": chat_id, "now": time.time()})
+        await self.flush()
+
+    @metrics.timed(metrics.DB_SECONDS, method="remove_ban")
+    async def remove_ban(self, chat_id, user_id) -> bool:
+        """
+        Remove ban of user in chat; user becomes "not going" in events which are not started yet
+        :return: False if user was not banned
+        """
+        chat_id = int(chat_id)
+        user_id = int(user_id)
+        db: aiosqlite.Connection = await self._get_db()
+        async with self.__write_lock:
+            async with db.execute(self.SQL_DELETE_BAN, (chat_id, user_id)) as cursor:
+                removed = cursor.rowcount > 0
+            await db.execute(self.SQL_UPDATE_UPCOMING_MEMBER_STATE,
+                             {"new_state": self.STATE_NOT_GOING, "state": self.STATE_BANNED, "user_id": user_id,
+                              "chat_id": chat_id, "now": time.time()})
+        await self.flush()
+        return removed
+
+    @metrics.timed(metrics.DB_SECONDS, method="purge_expired_bans")
+    async def purge_expired_bans(self, now):
+        """
+        Remove bans expired at `now`, see remove_ban()
+        :return: list of (chat_id, user_id) of removed bans
+        """
+        now = float(now)
+        db: aiosqlite.Connection = await self._get_db()
+        removed = []
+        async with self.__write_lock:
+            async with db.execute(self.SQL_SELECT_EXPIRED_BANS, (now,)) as cursor:
+                rows = await cursor.fetchall()
+            for chat_id, user_id in rows:
+                async with db.execute(self.SQL_DELETE_EXPIRED_BAN, (chat_id, user_id, now)) as cursor:
+                    if cursor.rowcount == 0:
+                        continue
+                await db.execute(self.SQL_UPDATE_UPCOMING_MEMBER_STATE,
+                                 {"new_state": self.STATE_NOT_GOING, "state": self.STATE_BANNED, "user_id": user_id,
+                                  "chat_id": chat_id, "now": time.time()})
+                removed.append((chat_id, user_id))
+        await self.flush()
+        return removed
+
+    @metrics.timed(metrics.DB_SECONDS, method="find_chat_user")
+    async def find_chat_user(self, chat_id, username):
+        """
+        :return: (user_id, name) of member of chat events with given Telegram nick, or None
+        """
+        db: aiosqlite.Connection = await self._get_db()
+        async with db.execute(self.SQL_FIND_CHAT_USER, (str(username), int(chat_id))) as cursor:
+            row = await cursor.fetchone()
+        return row
+
+    SQL_SELECT_TEMPLATES = "select chat_id, name, params from event_template"
+    SQL_SELECT_CHAT_TEMPLATES = "select chat_id, name, params from event_template where chat_id=?"
+    SQL_UPSERT_TEMPLATE = (
+        "insert into event_template(chat_id, name, params) values(?, ?, ?) "
+        "on conflict(chat_id, name) do update set params=excluded.params"
+    )
+    SQL_DELETE_TEMPLATE = "delete from event_template where chat_id=? and name=?"
+
+    @metrics.timed(metrics.DB_SECONDS, method="get_templates")
+    async def get_templates(self, chat_id=None):
+        """
+        :param chat_id: chat of templates, None for all chats
+        :return: list of (chat_id, name, params)
+        """
+        db: aiosqlite.Connection = await self._get_db()
+        if chat_id is None:
+            cursor = await db.execute(self.SQL_SELECT_TEMPLATES)
+        else:
+            cursor = await db.execute(self.SQL_SELECT_CHAT_TEMPLATES, (int(chat_id),))
+        async with cursor:
             rows = await cursor.fetchall()
         return rows
 
+    @metrics.timed(metrics.DB_SECONDS, method="save_template")
+    async def save_template(self, chat_id, name, params):
+        """Create or replace template of chat"""
+        await self._write(self.SQL_UPSERT_TEMPLATE, (int(chat_id), str(name), str(params)))
+
+    @metrics.timed(metrics.DB_SECONDS, method="delete_template")
+    async def delete_template(self, chat_id, name) -> bool:
+        """
+        :return: False if chat has no template with this name
+        """
+        db: aiosqlite.Connection = await self._get_db()
+        async with self.__write_lock:
+            async with db.execute(self.SQL_DELETE_TEMPLATE, (int(chat_id), str(name))) as cursor:
+                removed = cursor.rowcount > 0
+        await self._write_done()
+        return removed
+
+    SQL_INSERT_PROCESSED_UPDATE = "insert or ignore into processed_update(key, timestamp) values(?, ?)"
+    SQL_SELECT_PROCESSED_UPDATES = (
+        "select key from (select key, timestamp from processed_update order by timestamp desc limit ?) "
+        "order by timestamp"
+    )
+    SQL_PURGE_PROCESSED_UPDATES = "delete from processed_update where timestamp<?"
+
+    @metrics.timed(metrics.DB_SECONDS, method="add_processed_updates")
+    async def add_processed_updates(self, rows):
+        """
+        :param rows: list of (key, timestamp)
+        """
+        db: aiosqlite.Connection = await self._get_db()
+        async with self.__write_lock:
+            await db.executemany(self.SQL_INSERT_PROCESSED_UPDATE, [(str(k), float(ts)) for k, ts in rows])
+        await self._write_done()
+
+    @metrics.timed(metrics.DB_SECONDS, method="get_processed_updates")
+    async def get_processed_updates(self, limit):
+        """
+        :return: keys of last `limit` processed updates, oldest first
+        """
+        db: aiosqlite.Connection = await self._get_db()
+        async with db.execute(self.SQL_SELECT_PROCESSED_UPDATES, (int(limit),)) as cursor:
+            rows = await cursor.fetchall()
+        return [row[0] for row in rows]
+
+    @metrics.timed(metrics.DB_SECONDS, method="purge_processed_updates")
+    async def purge_processed_updates(self, before):
+        """Remove keys of updates processed before given timestamp"""
+        await self._write(self.SQL_PURGE_PROCESSED_UPDATES, (float(before),))
+
+    SQL_INSERT_JOB = "insert or ignore into event_job(event_id, kind, due) values(?, ?, ?)"
+    SQL_SELECT_PENDING_JOBS = (
+        "select event_job.due, event_job.event_id, event.chat_id, event_job.kind "
+        "from event_job join event on event.id=event_job.event_id "
+        "where event_job.done=0 order by event_job.due"
+    )
+    SQL_CLAIM_JOB = "update event_job set done=1 where event_id=? and kind=? and done=0"
+    # pending jobs of chat which is being moved to another shard: done=2 until move is finished or rolled back
+    SQL_HOLD_CHAT_JOBS = (
+        "update event_job set done=2 where done=0 and event_id in (select id from event where chat_id=?)"
+    )
+    SQL_RELEASE_CHAT_JOBS = (
+        "update event_job set done=0 where done=2 and event_id in (select id from event where chat_id=?)"
+    )
+
+    @metrics.timed(metrics.DB_SECONDS, method="add_jobs")
+    async def add_jobs(self, event_id, jobs):
+        """
+        Schedule actions of event; already scheduled kinds are not changed
+        :param jobs: list of (kind, due timestamp)
+        """
+        db: aiosqlite.Connection = await self._get_db()
+        async with self.__write_lock:
+            await db.executemany(self.SQL_INSERT_JOB, [(int(event_id), str(kind), float(due)) for kind, due in jobs])
+        await self._write_done()
+
+    @metrics.timed(metrics.DB_SECONDS, method="get_pending_jobs")
+    async def get_pending_jobs(self):
+        """
+        :return: not started actions ordered by due time: list of (due, event_id, chat_id, kind)
+        """
+        db: aiosqlite.Connection = await self._get_db()
+        async with db.execute(self.SQL_SELECT_PENDING_JOBS) as cursor:
+            rows = await cursor.fetchall()
+        return rows
+
+    @metrics.timed(metrics.DB_SECONDS, method="claim_job")
+    async def claim_job(self, event_id, kind) -> bool:
+        """
+        Mark action as started. Committed immediately in any persistence mode:
+        after restart the action is not repeated
+        :return: True if action was pending, False if it was already started or removed
+        """
+        db: aiosqlite.Connection = await self._get_db()
+        async with self.__write_lock:
+            async with db.execute(self.SQL_CLAIM_JOB, (int(event_id), str(kind))) as cursor:
+                claimed = cursor.rowcount > 0
+        await self.flush()
+        return claimed
+
+    # outcome of every member of events with start <= event_time < end; chat_id NULL for all chats
+    SQL_MEMBER_OUTCOMES = (
+        "select e.chat_id, m.user_id, m.name, m.username, e.event_time, "
+        "m.state=1 as joined, "
+        "m.state=1 and row_number() over (partition by m.event_id order by m.state<>1, m.join_timestamp) "
+        "> e.players_limit as queued, "
+        "m.state=2 and m.count>0 as no_show, "
+        "case when m.state=1 and e.message_timestamp>0 and m.join_timestamp>=e.message_timestamp "
+        "then m.join_timestamp-e.message_timestamp end as reaction "
+        "from event e join event_member m on m.event_id=e.id "
+        "where e.event_time>=:start and e.event_time<:end and (:chat_id is null or e.chat_id=:chat_id)"
+    )
+    # name and username are taken from the latest event of player
+    SQL_AGGREGATE_OUTCOMES = (
+        "select chat_id, user_id, name, username, sum(joined), sum(queued), sum(no_show), "
+        "total(reaction), count(reaction), max(event_time) "
+        f"from ({SQL_MEMBER_OUTCOMES}) where true group by chat_id, user_id"
+    )
+    SQL_SUMMARIZE_STATS = (
+        "insert into player_stats(chat_id, user_id, name, username, games, queued, no_shows, "
+        "reaction_sum, reaction_count, last_event_time) "
+        f"{SQL_AGGREGATE_OUTCOMES} "
+        "on conflict(chat_id, user_id) do update set "
+        "name=excluded.name, "
+        "username=excluded.username, "
+        "games=games+excluded.games, "
+        "queued=queued+excluded.queued, "
+        "no_shows=no_shows+excluded.no_shows, "
+        "reaction_sum=reaction_sum+excluded.reaction_sum, "
+        "reaction_count=reaction_count+excluded.reaction_count, "
+        "last_event_time=excluded.last_event_time"
+    )
+    # removes events from summary: used when imported summary has a later watermark than this database
+    SQL_UNSUMMARIZE_STATS = (
+        "insert into player_stats(chat_id, user_id, name, username, games, queued, no_shows, "
+        "reaction_sum, reaction_count, last_event_time) "
+        f"select * from ({SQL_AGGREGATE_OUTCOMES}) a "
+        "where exists(select 1 from player_stats p where p.chat_id=a.chat_id and p.user_id=a.user_id) "
+        "on conflict(chat_id, user_id) do update set "
+        "games=games-excluded.games, "
+        "queued=queued-excluded.queued, "
+        "no_shows=no_shows-excluded.no_shows, "
+        "reaction_sum=reaction_sum-excluded.reaction_sum, "
+        "reaction_count=reaction_count-excluded.reaction_count"
+    )
+    # summary table plus events finished after it was updated (start = summarized_until, end = now)
+    SQL_PLAYER_STATS = (
+        "select chat_id, user_id, name, username, sum(games) as games, sum(queued), sum(no_shows), "
+        "total(reaction_sum) / nullif(sum(reaction_count), 0), max(last_event_time) "
+        "from (select chat_id, user_id, name, username, games, queued, no_shows, reaction_sum, reaction_count, "
+        "last_event_time from player_stats where :chat_id is null or chat_id=:chat_id "
+        f"union all {SQL_AGGREGATE_OUTCOMES}) "
+        "group by chat_id, user_id order by chat_id, games desc, name limit :limit"
+    )
+    SQL_SELECT_STATS_STATE = "select value from stats_state where name=?"
+    SQL_UPSERT_STATS_STATE = (
+        "insert into stats_state(name, value) values(?, ?) on conflict(name) do update set value=excluded.value"
+    )
+    SQL_SUMMARY_BATCH_END = "select event_time from event where event_time>=? and event_time<? order by event_time limit 1 offset ?"
+
+    @metrics.timed(metrics.DB_SECONDS, method="summarize_stats")
+    async def summarize_stats(self, until, batch_size=2000) -> bool:
+        """
+        Add next batch of events finished before `until` to player_stats
+        :return: True when all events before `until` are summarized
+        """
+        until = float(until)
+        db: aiosqlite.Connection = await self._get_db()
+        async with self.__write_lock:
+            async with db.execute(self.SQL_SELECT_STATS_STATE, ("summarized_until",)) as cursor:
+                row = await cursor.fetchone()
+            start = row[0] if row is not None else 0.0
+            if start >= until:
+                return True
+            async with db.execute(self.SQL_SUMMARY_BATCH_END, (start, until, int(batch_size))) as cursor:
+                row = await cursor.fetchone()
+            end = until if row is None or row[0] <= start else row[0]
+            # summary and its watermark are changed in one transaction
+            await db.execute(self.SQL_SUMMARIZE_STATS, {"start": start, "end": end, "chat_id": None})
+            await db.execute(self.SQL_UPSERT_STATS_STATE, ("summarized_until", end))
+        await self._write_done()
+        return end >= until
+
+    @metrics.timed(metrics.DB_SECONDS, method="get_player_stats")
+    async def get_player_stats(self, chat_id=None, limit=-1):
+        """
+        Attendance statistics of players, see player_stats table
+        :param chat_id: chat of statistics, None for all chats
+        :param limit: maximal count of rows, -1 for all
+        :return: list of (chat_id, user_id, name, username, games, queued, no_shows, average reaction seconds or None,
+            time of last event); players of each chat are ordered by count of games
+        """
+        db: aiosqlite.Connection = await self._get_db()
+        # summary and watermark are read together: summarize_stats() changes them by two statements
+        async with self.__write_lock:
+            async with db.execute(self.SQL_SELECT_STATS_STATE, ("summarized_until",)) as cursor:
+                row = await cursor.fetchone()
+            params = {"start": row[0] if row is not None else 0.0, "end": time.time(),
+                      "chat_id": None if chat_id is None else int(chat_id), "limit": int(limit)}
+            async with db.execute(self.SQL_PLAYER_STATS, params) as cursor:
+                rows = await cursor.fetchall()
+        return rows
+
+    # tables with rows of chat: table -> query of chat rows
+    CHAT_TABLES = {
+        "event": "select * from event where chat_id=?",
+        "event_member": "select * from event_member where event_id in (select id from event where chat_id=?)",
+        "ban": "select * from ban where chat_id=?",
+        "event_job": "select * from event_job where event_id in (select id from event where chat_id=?)",
+        "event_template": "select * from event_template where chat_id=?",
+        "player_stats": "select * from player_stats where chat_id=?",
+    }
+
+    @metrics.timed(metrics.DB_SECONDS, method="reserve_ids")
+    async def reserve_ids(self, first_id):
+        """
+        Make primary keys of new rows start from first_id: shards use disjoint ranges of ids
+        """
+        db: aiosqlite.Connection = await self._get_db()
+        async with self.__write_lock:
+            for table in self.CHAT_TABLES:
+                async with db.execute("select seq from sqlite_sequence where name=?", (table,)) as cursor:
+                    row = await cursor.fetchone()
+                if row is None:
+                    await db.execute("insert into sqlite_sequence(name, seq) values(?, ?)", (table, int(first_id) - 1))
+                elif row[0] < first_id - 1:
+                    await db.execute("update sqlite_sequence set seq=? where name=?", (int(first_id) - 1, table))
+        await self.flush()
+
+    @metrics.timed(metrics.DB_SECONDS, method="export_chat")
+    async def export_chat(self, chat_id) -> dict:
+        """
+        Export is the first step of chat move: pending jobs of chat are held, so they are not run
+        by this database while target imports them; see release_chat_jobs()
+        :return: all rows of chat: table -> (column names, list of rows);
+            also "chat_id" and "summarized_until" - watermark of player_stats rows
+        """
+        db: aiosqlite.Connection = await self._get_db()
+        result = {"chat_id": int(chat_id)}
+        # rows and watermark of statistics are read consistently with summarize_stats()
+        async with self.__write_lock:
+            for table, sql in self.CHAT_TABLES.items():
+                async with db.execute(sql, (int(chat_id),)) as cursor:
+                    rows = await cursor.fetchall()
+                    result[table] = ([column[0] for column in cursor.description], rows)
+            async with db.execute(self.SQL_SELECT_STATS_STATE, ("summarized_until",)) as cursor:
+                row = await cursor.fetchone()
+            result["summarized_until"] = row[0] if row is not None else 0.0
+            await db.execute(self.SQL_HOLD_CHAT_JOBS, (int(chat_id),))
+        await self.flush()
+        return result
+
+    @metrics.timed(metrics.DB_SECONDS, method="release_chat_jobs")
+    async def release_chat_jobs(self, chat_id):
+        """Make jobs held by export_chat() pending again when move of chat is rolled back"""
+        await self._write(self.SQL_RELEASE_CHAT_JOBS, (int(chat_id),))
+
+    @metrics.timed(metrics.DB_SECONDS, method="import_chat")
+    async def import_chat(self, data: dict) -> dict:
+        """
+        Store rows exported by export_chat(). Rows get new primary keys of this database
+        :return: old event id -> new event id
+        """
+        db: aiosqlite.Connection = await self._get_db()
+        event_ids = {}
+        async with self.__write_lock:
+            # failed import leaves no rows in group commit transaction
+            if not db.in_transaction:
+                await db.execute("begin")
+            await db.execute("savepoint import_chat")
+            try:
+                for table in self.CHAT_TABLES:
+                    columns, rows = data.get(table, ([], []))
+                    if not rows:
+                        continue
+                    id_index = columns.index("id")
+                    names = [c for c in columns if c != "id"]
+                    sql = f"insert into {table}({','.join(names)}) values({','.join('?' * len(names))})"
+                    event_id_index = columns.index("event_id") if "event_id" in columns else None
+                    for row in rows:
+                        values = list(row)
+                        if event_id_index is not None:
+                            values[event_id_index] = event_ids[values[event_id_index]]
+                        del values[id_index]
+                        async with db.execute(sql, values) as cursor:
+                            if table == "event":
+                                event_ids[row[id_index]] = cursor.lastrowid
+                if "summarized_until" in data:
+                    await self.__reconcile_stats(data["chat_id"], data["summarized_until"])
+                await db.execute("release import_chat")
+            except Exception:
+                await db.execute("rollback to import_chat")
+                await db.execute("release import_chat")
+                raise
+        await self.flush()
+        return event_ids
+
+    async def __reconcile_stats(self, chat_id, imported_until):
+        """
+        Imported player_stats include events of chat before imported_until, while this database summarizes
+        events before its own watermark: events between the two watermarks are added to or removed from summary
+        """
+        db: aiosqlite.Connection = await self._get_db()
+        async with db.execute(self.SQL_SELECT_STATS_STATE, ("summarized_until",)) as cursor:
+            row = await cursor.fetchone()
+        summarized_until = row[0] if row is not None else 0.0
+        if imported_until < summarized_until:
+            await db.execute(self.SQL_SUMMARIZE_STATS,
+                             {"start": imported_until, "end": summarized_until, "chat_id": int(chat_id)})
+        elif imported_until > summarized_until:
+            await db.execute(self.SQL_UNSUMMARIZE_STATS,
+                             {"start": summarized_until, "end": imported_until, "chat_id": int(chat_id)})
+
+    @metrics.timed(metrics.DB_SECONDS, method="delete_chat")
+    async def delete_chat(self, chat_id):
+        """Remove all rows of chat"""
+        db: aiosqlite.Connection = await self._get_db()
+        chat_id = int(chat_id)
+        async with self.__write_lock:
+            await db.execute("delete from event_member where event_id in (select id from event where chat_id=?)",
+                             (chat_id,))
+            await db.execute("delete from event_job where event_id in (select id from event where chat_id=?)",
+                             (chat_id,))
+            await db.execute("delete from event where chat_id=?", (chat_id,))
+            await db.execute("delete from ban where chat_id=?", (chat_id,))
+            await db.execute("delete from event_template where chat_id=?", (chat_id,))
+            await db.execute("delete from player_stats where chat_id=?", (chat_id,))
+        await self.flush()
+
+    # finished events: moved to archive in batches, see archive_events()
+    SQL_ARCHIVE_BATCH = "select id from event where event_time<? order by event_time limit ?"
+    SQL_COPY_EVENTS_TO_ARCHIVE = "insert or ignore into archive.event select * from event where id in ({ids})"
+    SQL_COPY_MEMBERS_TO_ARCHIVE = (
+        "insert or ignore into archive.event_member select * from event_member where event_id in ({ids})"
+    )
+    SQL_DELETE_ARCHIVED = [
+        "delete from event_member where event_id in ({ids})",
+        "delete from event_job where event_id in ({ids})",
+        "delete from event where id in ({ids})",
+    ]
+
+    @metrics.timed(metrics.DB_SECONDS, method="archive_events")
+    async def archive_events(self, before, batch_size=500) -> int:
+        """
+        Move one batch of events finished before given timestamp with their members to archive database.
+        Rows are committed to archive first and then removed from live tables: interrupted move is
+        completed by the next call without duplicates
+        :return: count of moved events; 0 when nothing left to move
+        """
+        db: aiosqlite.Connection = await self._get_db()
+        async with self.__write_lock:
+            if db.in_transaction:
+                await db.commit()
+            async with db.execute(self.SQL_ARCHIVE_BATCH, (float(before), int(batch_size))) as cursor:
+                event_ids = [row[0] for row in await cursor.fetchall()]
+            if not event_ids:
+                return 0
+            ids = ",".join("?" * len(event_ids))
+            await db.execute(self.SQL_COPY_EVENTS_TO_ARCHIVE.format(ids=ids), event_ids)
+            await db.execute(self.SQL_COPY_MEMBERS_TO_ARCHIVE.format(ids=ids), event_ids)
+            await db.commit()
+            for sql in self.SQL_DELETE_ARCHIVED:
+                await db.execute(sql.format(ids=ids), event_ids)
+            await db.commit()
+        return len(event_ids)
+
+    @metrics.timed(metrics.DB_SECONDS, method="optimize")
+    async def optimize(self, vacuum_pages=2000):
+        """
+        Maintenance of database file: return up to vacuum_pages free pages to file system
+        and update statistics of query planner
+        """
+        db: aiosqlite.Connection = await self._get_db()
+        async with self.__write_lock:
+            if db.in_transaction:
+                await db.commit()
+            # database is switched to incremental vacuum by migrate(), otherwise the pragma does nothing;
+            # every step of the pragma frees one page; execute() of sqlite3 module makes only one step
+            # for statement without result columns, executescript() runs it to completion
+            await db.executescript(f"pragma incremental_vacuum({int(vacuum_pages)});")
+            await db.execute("analyze main")
+            await db.execute("analyze archive")
+            if db.in_transaction:
+                await db.commit()
+
     @staticmethod
-    def instance(db_path = None):
+    def instance(db_path = None, commit_delay = 0.0, archive_path = None):
         if FootballBotDatabase.global_instance is None:
             if db_path is None:
                 return None
             else:
-                FootballBotDatabase.global_instance = FootballBotDatabase(db_path)
+                FootballBotDatabase.global_instance = FootballBotDatabase(db_path, commit_delay, archive_path)
         return FootballBotDatabase.global_instance
\ No newline at end of file
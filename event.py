@@ -6,55 +6,134 @@ Event description for KT Football bot
 import datetime
 import re
 import time
+from html import escape
 from time import strftime
-from dataclasses import dataclass
 
 from database import FootballBotDatabase
 
-@dataclass
+
 class Event:
     """
     Event description with methods to create/update/delete event in database
     """
-    title : str
-    time : datetime.datetime
-    address : str = ""
-    players_limit : int = 21
-
-    def __init__(self, message_text: str, db_id: int = None):
-        self.title = ""
-        self.time = datetime.datetime.now()
-        self.players_limit = 21
-        self.address = ""
+    __slots__ = ("title", "address", "players_limit", "_time", "_timestamp", "__db_id", "chat_id", "message_id",
+                 "message_time", "publish_time", "players", "__compiled_on")
+
+    def __init__(self, message_text: str, db_id: int = None, prototype: "Event" = None, day: datetime.date = None):
+        """
+        :param message_text: text with "key=value" parameters of event
+        :param db_id: primary key of stored event; stored event is not filled by defaults
+        :param prototype: defaults of new event compiled by Event.compile_prototype(), built-in defaults if None
+        :param day: date of new event; by default taken from prototype
+        """
+        if db_id is None:
+            self.__fill_default(prototype if prototype is not None else _builtin_prototype(), day)
+        else:
+            self.title = ""
+            self.time = datetime.datetime.now()
+            self.players_limit = 21
+            self.address = ""
         self.__db_id = db_id
-        self.update_param(message_text, fill_default=db_id is None)
+        # where event message is posted; message_id is None until message is sent
+        self.chat_id = None
+        self.message_id = None
+        self.message_time = None
+        # when event message should be posted; None to post immediately
+        self.publish_time = None
+        # roster: user_id -> Player; None until loaded from database
+        self.players = None
+        self.update_param(message_text)
+
+    @staticmethod
+    def compile_prototype(params_text: str = "") -> "Event":
+        """
+        Compile defaults of new events: built-in defaults updated by template parameters.
+        Prototype is passed to Event() which copies its fields; time of prototype is relative
+        to the day of compilation (default "tomorrow" means day after creation of event),
+        unless parameters give exact date
+        """
+        item = Event.__new__(Event)
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        item.time = datetime.datetime(year=tomorrow.year, month=tomorrow.month, day=tomorrow.day, hour=19, minute=0)
+        # None - title is made from date of event
+        item.title = None
+        item.address = "🏟 Футбольне поле, вул. Липи, 6-А"
+        item.players_limit = 21
+        item.publish_time = None
+        item.update_param(params_text)
+        # None - exact date, it is not moved to the day of event creation
+        item.__compiled_on = datetime.date.today()
+        for reg_res in _PARAM_RE.finditer(params_text):
+            if Event.__PARAM_HANDLERS.get(reg_res.group(1).lower()) is Event.__update_date_time:
+                value = reg_res.group(2)
+                if _DAY_HINT_RE.search(value.lower()) is not None:
+                    item.__compiled_on = datetime.date.today()
+                elif _DATE_RE.search(value) is not None:
+                    item.__compiled_on = None
+        return item
+
+    def __fill_default(self, prototype: "Event", day: datetime.date):
+        if day is None and prototype.__compiled_on is None:
+            self.time = prototype.time
+        elif day is None:
+            self.time = prototype.time + datetime.timedelta(days=(datetime.date.today() - prototype.__compiled_on).days)
+        else:
+            self.time = datetime.datetime.combine(day, prototype.time.time())
+        if prototype.title is None:
+            self.title = f"⚽️Футбол {self.time.day}-{self.time.month}-{self.time.year} {self.time.hour}:{self.time.minute}⚽️"
+        else:
+            self.title = prototype.title
+        self.address = prototype.address
+        self.players_limit = prototype.players_limit
+
+    @property
+    def time(self) -> datetime.datetime:
+        """Event start time, local; events loaded from database convert timestamp on first access"""
+        if self._time is None:
+            self._time = datetime.datetime.fromtimestamp(int(self._timestamp))
+        return self._time
+
+    @time.setter
+    def time(self, value: datetime.datetime):
+        self._time = value
+        self._timestamp = time.mktime(value.timetuple())
+
+    def timestamp(self) -> float:
+        """Event start time as unix timestamp"""
+        return self._timestamp
+
+    def __repr__(self):
+        return (f"Event(id={self.__db_id}, title={self.title!r}, time={self.time}, address={self.address!r}, "
+                f"players_limit={self.players_limit})")
+
+    def version_tag(self) -> str:
+        """
+        Short tag of event message version, used in callback data of message buttons:
+        message posted again gets new message time and new tag
+        """
+        if self.message_time is None:
+            return ""
+        return f"{int(self.message_time * 1000) & 0xffff:04x}"
+
+    @property
+    def db_id(self) -> int:
+        """Primary key of event in database (None if event is not stored yet)"""
+        return self.__db_id
 
     def update_param(self, message_text: str, fill_default: bool = False):
         """
         Update event description.
         :param message_text:
-        :param fill_default: True in case of need to fill event fields by pre-coded default values,
+        :param fill_default: True in case of need to fill event fields by built-in default values,
             False for update from message only
         """
         if fill_default:
-            # fill default parameters for event
-            # local date time
-            event_date_time =  datetime.datetime.today() + datetime.timedelta(days=1)
-            event_date_time = datetime.datetime(year=event_date_time.year, month=event_date_time.month,
-                                                day=event_date_time.day, hour=19, minute=0, second=0)
-            self.time = event_date_time
-            self.title = (f"⚽️Футбол {event_date_time.day}-{event_date_time.month}-{event_date_time.year} "
-                           f"{event_date_time.hour}:{event_date_time.minute}⚽️")
-            self.address = "🏟 Футбольне поле, вул. Липи, 6-А"
-            self.players_limit = 21
-            #TODO: use per-channel default templates
-        for long_line in message_text.splitlines():
-            for line in long_line.split(";"):
-                reg_res = re.search(r"(\w+)[=:](.+)", line)
-                if reg_res is not None:
-                    name = reg_res.group(1)
-                    value = reg_res.group(2)
-                    self.__update(name, value)
+            self.__fill_default(_builtin_prototype(), None)
+        # single pass over message: first "key=value" (or "key: value") in each line or ";"-separated part
+        for reg_res in _PARAM_RE.finditer(message_text):
+            handler = self.__PARAM_HANDLERS.get(reg_res.group(1).lower())
+            if handler is not None:
+                handler(self, reg_res.group(2))
 
     def load_from_db(self, db_id):
         """
@@ -63,19 +142,39 @@ class Event:
         """
         pass
 
-    def store_to_db(self, chat_id: int):
+    async def store_to_db(self, chat_id: int):
         """
         Store event to database - either create new record or update existing
         """
-        self.__db_id = FootballBotDatabase.instance().create_event(
+        self.chat_id = chat_id
+        self.message_time = time.time() if self.publish_time is None else time.mktime(self.publish_time.timetuple())
+        self.__db_id = await FootballBotDatabase.instance().create_event(
             event_title=self.title,
-            event_time=time.mktime(self.time.timetuple()),
+            event_time=self.timestamp(),
             event_address=self.address,
-            message_time=time.time(),
-            message_id=9,
+            message_time=self.message_time,
+            message_id=0,
             chat_id=chat_id,
             players_limit=self.players_limit,
         )
+        self.players = {}
+
+    @staticmethod
+    async def store_many_to_db(events: list["Event"], chat_id: int):
+        """
+        Store new events to database in one transaction
+        """
+        now = time.time()
+        for item in events:
+            item.chat_id = chat_id
+            item.message_time = now if item.publish_time is None else time.mktime(item.publish_time.timetuple())
+        ids = await FootballBotDatabase.instance().create_events(
+            [(item.title, item.timestamp(), item.address, item.message_time, 0, chat_id, item.players_limit)
+             for item in events]
+        )
+        for item, db_id in zip(events, ids):
+            item.__db_id = db_id
+            item.players = {}
 
     def remove_from_db(self):
         """
@@ -83,130 +182,271 @@ class Event:
         """
         pass
 
+    # Telegram limit of message text length, UTF-16 code units
+    MESSAGE_LIMIT = 4096
+    # space reserved for "... and N more" line of truncated roster
+    TRUNCATION_RESERVE = 64
+
     def create_html_message(self, chat_id):
+        """
+        Render event message: description, main list of players and queue beyond players limit.
+        Player lines are cached in Player objects, so join/leave renders only changed lines.
+        Roster which does not fit into Telegram message is truncated with "... and N more" line
+        """
         time_hint = strftime("%A %Y-%B-%d %H:%M", self.time.timetuple())
-        html = f"<b>{self.title}</b>\n{time_hint}\n{self.address}\nКількість гравців: {self.players_limit}\n\n"
-        # load participants list
-        player_list = self.get_participants_list(chat_id)
-        #TODO: ban list here!
-        # counter = 1
-        # for player in player_list:
-        #     player_login = f" ({player.login})" if str(player.login) != "" else ""
-        #     html = html + f"{counter}. {player.name}{player_login}\n\t\t{time_reaction} сек ({player.hit_count})"
-        #     counter = counter + 1
-        #     if int(counter) == int(self.players_limit):
-        #         html = html + "\n\nЧерга: \n\n"
-        #     # "1. Viktor Sharov (the_viktorious)\n"
-        #     # f"\t\t⏱0.12 seconds\n"
-        #     # "2. Viktor Sharov (the_viktorious)\n"
-        #     # f"\t\t⏱0.21 seconds\n",
-        return html
+        html = (f"<b>{escape(self.title)}</b>\n{time_hint}\n{escape(self.address)}\n"
+                f"Кількість гравців: {self.players_limit}\n\n")
+        # banned users are not in roster: their members have STATE_BANNED, see FootballBotDatabase.add_ban()
+        parts = [html]
+        length = _text_length(html)
+        player_list = self.joined_players()
+        players_limit = int(self.players_limit)
+        for index, player in enumerate(player_list):
+            # queue is numbered from 1: the same place is reported by button answer
+            prefix = f"{index + 1}. " if index < players_limit else f"{index - players_limit + 1}. "
+            if index == players_limit:
+                prefix = "\nЧерга:\n\n" + prefix
+            line_length = _text_length(prefix) + player.html_length(self.message_time)
+            if length + line_length > self.MESSAGE_LIMIT - self.TRUNCATION_RESERVE:
+                rest = len(player_list) - index
+                parts.append(f"\n... та ще {rest} у черзі" if index >= players_limit else f"\n... та ще {rest}")
+                break
+            parts.append(prefix)
+            parts.append(player.html(self.message_time))
+            length += line_length
+        return "".join(parts)
+
+    @staticmethod
+    async def event_list(chat_id: int, since: float = None) -> list["Event"]:
+        """
+        :param since: timestamp; by default now - only upcoming events
+        """
+        db_event_list =  await FootballBotDatabase.instance().get_upcoming_events(chat_id=chat_id, since=since)
+        return Event.from_rows(db_event_list)
+
+    @staticmethod
+    def from_rows(rows) -> list["Event"]:
+        """Create events from rows of event table"""
+        from_row = Event.from_row
+        return [from_row(row) for row in rows]
 
     @staticmethod
-    async def event_list(chat_id: int) -> list["Event"]:
-        db_event_list =  await FootballBotDatabase.instance().get_all_events(chat_id=chat_id)
-        result = []
-        for row in db_event_list:
-            # id, event_title, event_time, event_address, message_timestamp, message_id, chat_id, players_limit
-            item = Event(message_text="", db_id=int(row[0]))
-            item.title = str(row[1])
-            item.time = datetime.datetime.fromtimestamp(int(row[2]))
-            item.address = str(row[3])
-            item.players_limit = int(row[7])
-            result.append(item)
-        return result
-
-    @dataclass
+    def from_row(row) -> "Event":
+        """
+        Create event from row of event table without parsing: time is converted to datetime on first access
+        """
+        # id, event_title, event_time, event_address, message_timestamp, message_id, chat_id, players_limit
+        item = Event.__new__(Event)
+        item.__db_id = row[0]
+        item.title = row[1]
+        item._time = None
+        item._timestamp = row[2]
+        item.address = row[3]
+        item.message_time = row[4]
+        item.message_id = row[5]
+        item.chat_id = row[6]
+        item.players_limit = row[7]
+        item.publish_time = None
+        item.players = None
+        return item
+
     class Player:
         """
         Player record in this particular event
         """
-        # telegram name for user in event
-        name: str
-        # telegram login (if set) of user in event
-        login: str
-        # state of user: "yes", "no", "ban"
-        state: str
-        # when joined to event
-        join_time: datetime.datetime
-        # how many times pressed "join" button
-        count: int = 0
-
-    async def get_participants_list(self, chat_id):
-        player_list = []
+        __slots__ = ("user_id", "name", "login", "state", "join_timestamp", "count", "_html", "_html_length")
+
+        def __init__(self, user_id: int, name: str, login: str, state: int, join_timestamp: float, count: int = 0):
+            # telegram user id
+            self.user_id = user_id
+            # telegram name for user in event
+            self.name = name
+            # telegram login (if set) of user in event
+            self.login = login
+            # state of user: FootballBotDatabase.STATE_JOINED, STATE_NOT_GOING, STATE_BANNED
+            self.state = state
+            # when joined to event, unix timestamp
+            self.join_timestamp = join_timestamp
+            # how many times pressed "join" button
+            self.count = count
+            # rendered roster line and its length; player object is replaced on each update
+            self._html = None
+            self._html_length = 0
+
+        def __repr__(self):
+            return (f"Player(user_id={self.user_id}, name={self.name!r}, login={self.login!r}, state={self.state}, "
+                    f"join_timestamp={self.join_timestamp}, count={self.count})")
+
+        def html(self, message_time: float) -> str:
+            """
+            Roster line of player (without position number)
+            :param message_time: when event message was posted, to show reaction time
+            """
+            if self._html is None:
+                login = f" ({escape(self.login)})" if self.login else ""
+                reaction = f"⏱{self.join_timestamp - message_time:.2f} сек " if message_time else ""
+                self._html = f"{escape(str(self.name))}{login}\n\t\t{reaction}({self.count})\n"
+                self._html_length = _text_length(self._html)
+            return self._html
+
+        def html_length(self, message_time: float) -> int:
+            self.html(message_time)
+            return self._html_length
+
+        @staticmethod
+        def from_row(row) -> "Event.Player":
+            # id, event_id, user_id, name, username, join_timestamp, state, count
+            return Event.Player(row[2], row[3], row[4] or "", row[6], row[5], row[7])
+
+    async def load_players(self):
+        """Load roster of event from database"""
+        players = {}
         if self.__db_id is not None:
-            db_list =  await FootballBotDatabase.instance().get_member_list(self.__db_id)
-        return db_list
-        # return player_list
+            from_row = Event.Player.from_row
+            for row in await FootballBotDatabase.instance().get_member_list(self.__db_id):
+                players[row[2]] = from_row(row)
+        self.players = players
+
+    @staticmethod
+    async def load_players_of_events(events: list["Event"], chat_id: int, since: float = None):
+        """
+        Load rosters of many events of chat with one query
+        :param since: the same as in event_list() which loaded events
+        """
+        by_id = {}
+        for item in events:
+            item.players = {}
+            by_id[item.__db_id] = item.players
+        from_row = Event.Player.from_row
+        for row in await FootballBotDatabase.instance().get_chat_members(chat_id, since):
+            players = by_id.get(row[1])
+            if players is not None:
+                players[row[2]] = from_row(row)
+
+    async def get_participants_list(self, chat_id) -> list["Event.Player"]:
+        """
+        :return: joined players ordered by join time
+        """
+        if self.players is None:
+            await self.load_players()
+        return self.joined_players()
+
+    def joined_players(self) -> list["Event.Player"]:
+        """
+        :return: joined players of loaded roster ordered by join time
+        """
+        if self.players is None:
+            return []
+        player_list = [p for p in self.players.values() if p.state == FootballBotDatabase.STATE_JOINED]
+        player_list.sort(key=lambda p: p.join_timestamp)
+        return player_list
 
     async def update_message_id(self, msg_id):
+        self.message_id = msg_id
         if self.__db_id is not None:
             await FootballBotDatabase.instance().update_message_id_for_event(self.__db_id, msg_id)
 
-    def __update(self, name: str, value: str):
-        name = name.lower()
-        if name == "date" or name == "день" or name == "time" or name == "час" or name == "время":
-            self.__update_date_time(value)
-        if name == "title" or name == "опис" or name == "описание" or name == "заголовок":
-            self.title = value
-        if name == "address" or name == "адрес" or name == "адреса":
-            self.address = value
-        if name == "players_limit" or name == "limit" or name == "количество" or name == "кількість":
-            try:
-                self.players_limit = int(value)
-            except ValueError:
-                pass
-
-    def __update_date_time(self, value):
-        # date is dd-mm-yyyy; time is hh:mm
-        # possible variants: "today", "tomorrow"
-
-        reg_res = re.search(r"\+(\d+)\s+(\w+)", value)
-        if reg_res is not None:
-            # parse items like "+1 hour"
-            delta = None
-            step = int(reg_res.group(1))
-            hint = reg_res.group(2)
-            if hint.startswith("min") or hint.startswith("хв") or hint.startswith("мин"):
-                delta = datetime.timedelta(minutes=step)
-            if hint.startswith("hour") or hint.startswith("год") or hint.startswith("час"):
-                delta = datetime.timedelta(hours=step)
-            if hint.startswith("day") or hint.startswith("дн") or hint.startswith("ден"):
-                delta = datetime.timedelta(days=step)
-            if delta is not None:
-                self.time = self.time + delta
-
-        year = self.time.year
-        month = self.time.month
-        day = self.time.day
-        hour = self.time.hour
-        minute = self.time.minute
-
-        #exact date/time in format
-        reg_res = re.search(r"(\d{1,2})-(\d{1,2})-(\d{2,4})", value)
-        if reg_res is not None:
-            year = int(reg_res.group(3))
-            month = int(reg_res.group(2))
-            day = int(reg_res.group(1))
-            if year < 100:
-                year = 2000 + year
-        reg_res = re.search(r"(\d{1,2}):(\d{1,2})", value)
-        if reg_res is not None:
-            hour = int(reg_res.group(1))
-            minute = int(reg_res.group(2))
-
-        today_list = ["today", "сегодня", "сьогодні"]
-        tomorrow_list = ["tomorrow", "завтра"]
-        add_day = 0
-        for hint_list in [today_list, tomorrow_list]:
-            for hint in hint_list:
-                if value.find(hint) >= 0:
-                    t = datetime.datetime.today()
-                    if add_day >= 0:
-                        t = t + datetime.timedelta(days=1)
-                    year = t.year
-                    month = t.month
-                    day = t.day
-            add_day = 1
-
-        self.time = datetime.datetime(year=year, month=month, day=day, hour=hour, minute=minute, second=0)
+    def __set_title(self, value: str):
+        self.title = value
+
+    def __set_address(self, value: str):
+        self.address = value
+
+    def __set_players_limit(self, value: str):
+        try:
+            self.players_limit = int(value)
+        except ValueError:
+            pass
+
+    def __update_date_time(self, value: str):
+        self.time = _parse_date_time(value, self.time)
+
+    def __set_publish_time(self, value: str):
+        now = datetime.datetime.now()
+        self.publish_time = _parse_date_time(value, datetime.datetime(now.year, now.month, now.day, now.hour, now.minute))
+
+    # parameter name (any supported language) -> handler
+    __PARAM_HANDLERS = {
+        **dict.fromkeys(("date", "день", "дата", "time", "час", "время"), __update_date_time),
+        **dict.fromkeys(("title", "опис", "описание", "заголовок", "назва"), __set_title),
+        **dict.fromkeys(("address", "адрес", "адреса", "місце"), __set_address),
+        **dict.fromkeys(("players_limit", "limit", "количество", "кількість", "ліміт"), __set_players_limit),
+        **dict.fromkeys(("publish", "публікація", "публикация"), __set_publish_time),
+    }
+
+
+_builtin = None
+
+
+def _builtin_prototype() -> Event:
+    """Prototype with built-in defaults of events"""
+    global _builtin
+    if _builtin is None:
+        _builtin = Event.compile_prototype()
+    return _builtin
+
+
+def _parse_date_time(value: str, base: datetime.datetime) -> datetime.datetime:
+    """
+    Parse date/time parameter; parts which are not given are taken from base
+    """
+    # date is dd-mm-yyyy; time is hh:mm
+    # possible variants: "+1 hour", "today", "tomorrow"
+    reg_res = _RELATIVE_TIME_RE.search(value)
+    if reg_res is not None:
+        # parse items like "+1 hour"
+        hint = reg_res.group(2).lower()
+        for prefixes, unit in _RELATIVE_TIME_UNITS:
+            if hint.startswith(prefixes):
+                base = base + datetime.timedelta(**{unit: int(reg_res.group(1))})
+                break
+
+    year = base.year
+    month = base.month
+    day = base.day
+    hour = base.hour
+    minute = base.minute
+
+    #exact date/time in format
+    reg_res = _DATE_RE.search(value)
+    if reg_res is not None:
+        year = int(reg_res.group(3))
+        month = int(reg_res.group(2))
+        day = int(reg_res.group(1))
+        if year < 100:
+            year = 2000 + year
+    reg_res = _TIME_RE.search(value)
+    if reg_res is not None:
+        hour = int(reg_res.group(1))
+        minute = int(reg_res.group(2))
+
+    reg_res = _DAY_HINT_RE.search(value.lower())
+    if reg_res is not None:
+        t = datetime.datetime.today() + datetime.timedelta(days=_DAY_HINTS[reg_res.group(0)])
+        year = t.year
+        month = t.month
+        day = t.day
+
+    return datetime.datetime(year=year, month=month, day=day, hour=hour, minute=minute, second=0)
+
+
+def _text_length(text: str) -> int:
+    """Length of text as Telegram counts it (UTF-16 code units)"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+# "key=value" or "key: value" up to the end of line or ";"
+_PARAM_RE = re.compile(r"(\w+)[=:]([^;\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]+)")
+# relative time: "+1 hour", "+2 дні", "+30 хв"
+_RELATIVE_TIME_RE = re.compile(r"\+(\d+)\s+(\w+)")
+_RELATIVE_TIME_UNITS = (
+    (("min", "хв", "мин"), "minutes"),
+    (("hour", "год", "час"), "hours"),
+    (("day", "дн", "ден"), "days"),
+)
+_DATE_RE = re.compile(r"(\d{1,2})-(\d{1,2})-(\d{2,4})")
+_TIME_RE = re.compile(r"(\d{1,2}):(\d{1,2})")
+# day hint -> days from today; longer words first: "післязавтра" contains "завтра"
+_DAY_HINTS = {"післязавтра": 2, "послезавтра": 2, "today": 0, "сегодня": 0, "сьогодні": 0,
+              "tomorrow": 1, "завтра": 1}
+_DAY_HINT_RE = re.compile("|".join(_DAY_HINTS))
@@ -0,0 +1,199 @@
+"""
+In-memory cache of events and rosters for KT Football bot
+©Viktor Sharov, 2024
+"""
+
+import asyncio
+import logging
+import time
+
+from database import FootballBotDatabase, MemberUpdate
+from event import Event
+
+logger = logging.getLogger(__name__)
+
+
+class EventCache:
+    """
+    Per-chat cache of upcoming events with their rosters.
+    Reads are served from memory; writes go to database first (write-through) and then
+    update cached objects. Chat is loaded from database on first access, finished events are evicted.
+    """
+
+    #global instance
+    global_instance = None
+
+    # how often finished events are evicted, seconds
+    EVICTION_PERIOD = 60
+
+    def __init__(self, keep_finished: float = 3 * 3600, conflict_window: float = 3600):
+        """
+        :param keep_finished: how long event is kept in cache after its start time, seconds
+        :param conflict_window: events at the same address closer than this interval (seconds) are duplicates
+        """
+        self.__keep_finished = keep_finished
+        self.__conflict_window = conflict_window
+        # chat_id -> {event_id: Event}
+        self.__chats = {}
+        # (chat_id, normalized address, time bucket) -> list of events; bucket size is conflict_window
+        self.__buckets = {}
+        # (chat_id, message_id) -> Event
+        self.__messages = {}
+        # chat_id -> lock for loading chat from database
+        self.__loading = {}
+        self.__next_eviction = 0.0
+
+    async def events(self, chat_id: int) -> list[Event]:
+        """
+        :return: upcoming events of chat ordered by event time
+        """
+        chat = await self.__chat(chat_id)
+        return sorted(chat.values(), key=lambda e: e.time)
+
+    async def event_by_id(self, chat_id: int, event_id: int) -> Event:
+        """
+        :return: upcoming event of chat or None
+        """
+        chat = await self.__chat(chat_id)
+        return chat.get(event_id)
+
+    async def event_by_message(self, chat_id: int, message_id: int) -> Event:
+        """
+        :return: event posted as given message or None
+        """
+        await self.__chat(chat_id)
+        return self.__messages.get((chat_id, message_id))
+
+    async def add_event(self, event: Event, chat_id: int):
+        """Store new event to database and cache"""
+        chat = await self.__chat(chat_id)
+        await event.store_to_db(chat_id)
+        chat[event.db_id] = event
+        self.__bucket(chat_id, event).append(event)
+
+    async def add_events(self, events: list[Event], chat_id: int):
+        """Store many new events to database in one transaction and add them to cache"""
+        chat = await self.__chat(chat_id)
+        await Event.store_many_to_db(events, chat_id)
+        for event in events:
+            chat[event.db_id] = event
+            self.__bucket(chat_id, event).append(event)
+
+    async def find_conflict(self, chat_id: int, event: Event) -> Event:
+        """
+        Find event at the same address which starts closer than conflict window to given event
+        :return: conflicting event or None
+        """
+        await self.__chat(chat_id)
+        event_time = event.timestamp()
+        address = self.normalize_address(event.address)
+        if event_time < time.time() - self.__keep_finished:
+            # finished events are not cached: range query by (chat_id, event_time) index
+            rows = await FootballBotDatabase.instance().get_events_in_range(
+                chat_id, event_time - self.__conflict_window, event_time + self.__conflict_window
+            )
+            for item in Event.from_rows(rows):
+                if self.normalize_address(item.address) == address:
+                    return item
+            return None
+        # conflicting event could be only in the same or neighbour bucket
+        bucket = int(event_time // self.__conflict_window)
+        for key in ((chat_id, address, bucket - 1), (chat_id, address, bucket), (chat_id, address, bucket + 1)):
+            for item in self.__buckets.get(key, ()):
+                if abs(item.timestamp() - event_time) < self.__conflict_window:
+                    return item
+        return None
+
+    @staticmethod
+    def normalize_address(address: str) -> str:
+        return " ".join(str(address).lower().split())
+
+    def __bucket_key(self, chat_id: int, event: Event) -> tuple:
+        return chat_id, self.normalize_address(event.address), int(event.timestamp() // self.__conflict_window)
+
+    def __bucket(self, chat_id: int, event: Event) -> list:
+        return self.__buckets.setdefault(self.__bucket_key(chat_id, event), [])
+
+    async def set_message_id(self, event: Event, message_id: int):
+        """Store id of message with event to database and cache"""
+        await event.update_message_id(message_id)
+        self.__messages[(event.chat_id, message_id)] = event
+
+    async def add_member(self, event: Event, user_id: int, name: str, username: str, state: int) -> MemberUpdate:
+        """
+        Join/leave event: see FootballBotDatabase.add_member()
+        """
+        member = await FootballBotDatabase.instance().add_member(event.db_id, user_id, name, username, state)
+        if event.players is None:
+            await event.load_players()
+        event.players[user_id] = Event.Player(user_id=user_id, name=name, login=username or "", state=member.state,
+                                              join_timestamp=member.join_timestamp, count=member.count)
+        return member
+
+    async def reload_players(self, chat_id: int) -> list[Event]:
+        """
+        Load rosters of cached events of chat from database again, e.g. after ban list was changed
+        :return: reloaded events
+        """
+        chat = self.__chats.get(chat_id, {})
+        for event in chat.values():
+            await event.load_players()
+        return list(chat.values())
+
+    async def __chat(self, chat_id: int) -> dict:
+        chat = self.__chats.get(chat_id)
+        if chat is None:
+            lock = self.__loading.setdefault(chat_id, asyncio.Lock())
+            async with lock:
+                chat = self.__chats.get(chat_id)
+                if chat is None:
+                    chat = await self.__load_chat(chat_id)
+                    self.__chats[chat_id] = chat
+            self.__loading.pop(chat_id, None)
+        if time.monotonic() >= self.__next_eviction:
+            self.evict_finished()
+        return chat
+
+    async def __load_chat(self, chat_id: int) -> dict:
+        min_time = time.time() - self.__keep_finished
+        chat = {}
+        events = await Event.event_list(chat_id=chat_id, since=min_time)
+        # rosters of all events with one query
+        await Event.load_players_of_events(events, chat_id, since=min_time)
+        for event in events:
+            chat[event.db_id] = event
+            self.__bucket(chat_id, event).append(event)
+            if event.message_id:
+                self.__messages[(chat_id, event.message_id)] = event
+        logger.info(f"Loaded {len(chat)} events of chat {chat_id}")
+        return chat
+
+    def drop_chat(self, chat_id: int):
+        """Forget all cached data of chat; it is loaded from database again on next access"""
+        chat = self.__chats.pop(chat_id, None)
+        if chat is None:
+            return
+        for event in chat.values():
+            self.__messages.pop((chat_id, event.message_id), None)
+        self.__buckets = {key: value for key, value in self.__buckets.items() if key[0] != chat_id}
+
+    def evict_finished(self):
+        """Remove finished events from cache"""
+        self.__next_eviction = time.monotonic() + self.EVICTION_PERIOD
+        min_time = time.time() - self.__keep_finished
+        for chat in self.__chats.values():
+            for event_id, event in list(chat.items()):
+                if event.timestamp() < min_time:
+                    del chat[event_id]
+                    self.__messages.pop((event.chat_id, event.message_id), None)
+                    key = self.__bucket_key(event.chat_id, event)
+                    bucket = self.__buckets[key]
+                    bucket.remove(event)
+                    if not bucket:
+                        del self.__buckets[key]
+
+    @staticmethod
+    def instance(conflict_window: float = 3600) -> "EventCache":
+        if EventCache.global_instance is None:
+            EventCache.global_instance = EventCache(conflict_window=conflict_window)
+        return EventCache.global_instance
@@ -0,0 +1,107 @@
+"""
+Timer heap of scheduled event actions for KT Football bot
+©Viktor Sharov, 2024
+"""
+
+import asyncio
+import heapq
+import logging
+import time
+
+from database import FootballBotDatabase
+
+logger = logging.getLogger(__name__)
+
+
+class EventScheduler:
+    """
+    Runs scheduled actions of events (publishing, reminders, closing of roster) at their due time.
+    Pending actions are loaded once from database (indexed by done, due) into heap and then
+    updated incrementally by schedule(); single background task sleeps until the earliest action.
+    Every action is claimed in database before it is started, so it is not repeated after restart.
+    """
+
+    # maximal sleep, seconds: wall clock changes are noticed at least this often
+    MAX_SLEEP = 600
+
+    def __init__(self, run_job):
+        """
+        :param run_job: coroutine function run_job(kind, chat_id, event_id) which performs action
+        """
+        self.__run_job = run_job
+        # heap of (due timestamp, event_id, chat_id, kind)
+        self.__heap = []
+        self.__wakeup = asyncio.Event()
+        self.__task = None
+        # actions in progress
+        self.__running = set()
+        self.__stopped = False
+
+    async def start(self):
+        """Load pending actions and start background task in current event loop"""
+        await self.reload()
+        if self.__task is None:
+            self.__stopped = False
+            self.__task = asyncio.get_running_loop().create_task(self.__run())
+
+    async def stop(self):
+        """Stop background task; actions in progress are finished"""
+        # flag instead of cancel(): wait_for() may swallow cancellation when wakeup is set at the same moment
+        self.__stopped = True
+        self.__wakeup.set()
+        if self.__task is not None:
+            await self.__task
+            self.__task = None
+        if self.__running:
+            await asyncio.gather(*self.__running, return_exceptions=True)
+
+    async def reload(self):
+        """Replace heap with pending actions from database"""
+        rows = await FootballBotDatabase.instance().get_pending_jobs()
+        # rows are ordered by due time: sorted list is valid heap
+        self.__heap = [tuple(row) for row in rows]
+        self.__wakeup.set()
+        logger.info(f"Loaded {len(self.__heap)} scheduled event actions")
+
+    def schedule(self, due: float, event_id: int, chat_id: int, kind: str):
+        """
+        Add action stored by FootballBotDatabase.add_jobs() to heap
+        """
+        heapq.heappush(self.__heap, (due, event_id, chat_id, kind))
+        if self.__heap[0][0] == due:
+            # new earliest action: sleeping task has to recalculate timeout
+            self.__wakeup.set()
+
+    def pending(self) -> int:
+        return len(self.__heap)
+
+    async def __run(self):
+        db = FootballBotDatabase.instance()
+        while not self.__stopped:
+            self.__wakeup.clear()
+            timeout = self.MAX_SLEEP
+            if self.__heap:
+                timeout = min(timeout, self.__heap[0][0] - time.time())
+            if timeout > 0:
+                try:
+                    await asyncio.wait_for(self.__wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            due, event_id, chat_id, kind = heapq.heappop(self.__heap)
+            try:
+                if not await db.claim_job(event_id, kind):
+                    # started before restart, duplicate in heap or event removed
+                    continue
+            except Exception as e:
+                logger.error(f"Unable to claim {kind} of event {event_id}: {repr(e)}")
+                continue
+            task = asyncio.get_running_loop().create_task(self.__execute(kind, chat_id, event_id))
+            self.__running.add(task)
+            task.add_done_callback(self.__running.discard)
+
+    async def __execute(self, kind: str, chat_id: int, event_id: int):
+        try:
+            await self.__run_job(kind, chat_id, event_id)
+        except Exception as e:
+            logger.error(f"Scheduled {kind} of event {event_id} in chat {chat_id} failed: {repr(e)}")
@@ -0,0 +1,64 @@
+"""
+Offline export of player attendance statistics of KT Football bot to CSV or JSON
+Reads database file in read-only mode with the same aggregate queries as /kt_stats;
+can run next to working bot (WAL mode), it does not block bot.
+
+Run: python export_stats.py kt_football.db [--chat CHAT_ID] [--format csv|json] [--output FILE]
+©Viktor Sharov, 2024
+"""
+
+import argparse
+import csv
+import datetime
+import json
+import sqlite3
+import sys
+import time
+
+from database import FootballBotDatabase
+
+COLUMNS = ["chat_id", "user_id", "name", "username", "games", "queued", "no_shows", "avg_reaction_seconds",
+           "last_event_time"]
+
+
+def player_stats(db_path: str, chat_id: int = None) -> list[dict]:
+    db = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        row = db.execute(FootballBotDatabase.SQL_SELECT_STATS_STATE, ("summarized_until",)).fetchone()
+        params = {"start": row[0] if row is not None else 0.0, "end": time.time(), "chat_id": chat_id, "limit": -1}
+        result = []
+        for values in db.execute(FootballBotDatabase.SQL_PLAYER_STATS, params):
+            item = dict(zip(COLUMNS, values))
+            if item["last_event_time"] is not None:
+                item["last_event_time"] = datetime.datetime.fromtimestamp(item["last_event_time"]).isoformat()
+            result.append(item)
+        return result
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("db_path")
+    parser.add_argument("--chat", type=int, default=None, help="export only this chat")
+    parser.add_argument("--format", choices=("csv", "json"), default="csv")
+    parser.add_argument("--output", default=None, help="output file, standard output by default")
+    args = parser.parse_args()
+
+    rows = player_stats(args.db_path, args.chat)
+    out = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+    try:
+        if args.format == "json":
+            json.dump(rows, out, ensure_ascii=False, indent=1)
+            out.write("\n")
+        else:
+            writer = csv.DictWriter(out, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
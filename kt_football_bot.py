@@ -11,30 +11,50 @@ import sys
 
 import json
 import time
+from html import escape
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes, CallbackQueryHandler
+from telegram.ext import (ApplicationBuilder, ApplicationHandlerStop, CommandHandler, ContextTypes,
+                          CallbackQueryHandler, TypeHandler)
 
 import event as bot_event
 import database as bot_db
+import metrics
+from ban_list import BanList
+from event_cache import EventCache
+from event_scheduler import EventScheduler
+from message_updater import MessageUpdater
+from processed_updates import ProcessedUpdates
+from retention import Retention
+from templates import DEFAULT_TEMPLATE, EventTemplate, TemplateCache, template_name
 
 logger = logging.getLogger(__name__)
 
-current_periodic_task = None
-current_periodic_task_stopped = False
-current_periodic_task_queue = []
+# background re-render of event messages, created in post_init()
+message_updater: MessageUpdater = None
+# keyword arguments of MessageUpdater, set by configure()
+message_updater_options: dict = {}
+# metrics endpoint, created in main()
+metrics_server: metrics.MetricsServer = None
+# scheduled publishing, reminders and closing of events, created in post_init()
+event_scheduler: EventScheduler = None
+# reminder is sent this many seconds before event; 0 - no reminders
+remind_before: float = 7200
+# archival of finished events and database maintenance, created in configure()
+retention: Retention = None
+# event message which failed to be posted is posted again after this delay, seconds
+PUBLISH_RETRY_DELAY = 60
 
 
-async def regular_task():
-    global current_periodic_task_queue
-    while not current_periodic_task_stopped:
-        if len(current_periodic_task_queue) == 0:
-            time.sleep(2)
-            continue
-        queue = current_periodic_task_queue[:]
-        current_periodic_task_queue.clear()
+async def drop_duplicate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """First handler of every update: repeated webhook delivery stops processing before any other handler"""
+    if ProcessedUpdates.instance().is_duplicate(update):
+        metrics.inc(metrics.DUPLICATE_UPDATES_TOTAL)
+        logger.info(f"Dropped repeated update {update.update_id}")
+        raise ApplicationHandlerStop()
 
 
+@metrics.timed(metrics.HANDLER_SECONDS, handler="start")
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text(f"Hello from KT Football Bot")
 
@@ -48,77 +68,472 @@ def build_menu(buttons, n_cols, header_buttons=None, footer_buttons=None):
         menu.append([footer_buttons])
     return menu
 
-async def kt_create_event(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    # check if event with same address and same time already created
-    chat_id = update.message.chat_id
-    new_event = bot_event.Event(update.message.text)
-    logger.info(f"NOTE: message text is {update.message.text}")
-    event_list = await bot_event.Event.event_list(chat_id=chat_id)
-    for event in event_list:
-        if str(new_event.address).lower() == str(event.address).lower():
-            new_time = time.mktime(new_event.time.timetuple())
-            existing_time = time.mktime(event.time.timetuple())
-            if abs(new_time - existing_time) < 3600:
-                await update.message.reply_text(f"На цей час вже є запланована гра: {event.address} {event.time}",
-                                                parse_mode="HTML")
-                return
-    # store new event in database and create event message
-    new_event.store_to_db(update.message.chat_id)
 
+def event_markup(event: bot_event.Event) -> InlineKeyboardMarkup:
+    """
+    Join/leave buttons under event message.
+    Callback data is "ACTION:event_id:version" - click is routed to event without lookup by message
+    """
+    suffix = f":{event.db_id}:{event.version_tag()}"
     button_list = [
-        InlineKeyboardButton("Так", callback_data='ADD'),
-        InlineKeyboardButton("Ні", callback_data='REMOVE'),
+        InlineKeyboardButton("Так", callback_data='ADD' + suffix),
+        InlineKeyboardButton("Ні", callback_data='REMOVE' + suffix),
     ]
-    markup = InlineKeyboardMarkup(build_menu(button_list, n_cols=1))
+    return InlineKeyboardMarkup(build_menu(button_list, n_cols=1))
+
+
+def parse_callback_data(data: str):
+    """
+    Parse callback data created by event_markup()
+    :return: (action, event_id, version); event_id and version are None for buttons of old format
+    """
+    action, _, rest = str(data).partition(":")
+    event_id, _, version = rest.partition(":")
+    try:
+        return action, int(event_id), version
+    except ValueError:
+        return action, None, None
 
-    msg = await context.bot.send_message(
-        update.message.chat_id,
-        new_event.create_html_message(update.message.chat_id),
+
+def is_closed(event: bot_event.Event) -> bool:
+    """Roster is closed when event starts"""
+    return event.timestamp() <= time.time()
+
+
+async def render_event_message(bot, chat_id, event_id):
+    """Re-render event message with actual list of players; closed event has no buttons"""
+    event = await EventCache.instance().event_by_id(chat_id, event_id)
+    if event is None or not event.message_id:
+        return
+    await bot.edit_message_text(
+        event.create_html_message(chat_id),
+        chat_id=chat_id,
+        message_id=event.message_id,
         parse_mode="HTML",
-        reply_markup=markup
+        reply_markup=None if is_closed(event) else event_markup(event)
     )
-    await new_event.update_message_id(msg.id)
 
+
+async def publish_event(bot, event: bot_event.Event):
+    """Post event message with buttons to chat of event"""
+    msg = await bot.send_message(
+        event.chat_id,
+        event.create_html_message(event.chat_id),
+        parse_mode="HTML",
+        reply_markup=event_markup(event)
+    )
+    await EventCache.instance().set_message_id(event, msg.id)
+
+
+async def schedule_event_jobs(event: bot_event.Event, publish_time: float = None):
+    """
+    Store and schedule actions of new event:
+      - "publish" at publish_time (message time by default), if event message is not posted yet
+      - "remind" remind_before seconds before event
+      - "close" at event time
+    """
+    now = time.time()
+    event_time = event.timestamp()
+    jobs = [("close", event_time)]
+    if not event.message_id:
+        jobs.append(("publish", event.message_time if publish_time is None else publish_time))
+    if remind_before > 0 and event_time - remind_before > now:
+        jobs.append(("remind", event_time - remind_before))
+    await bot_db.FootballBotDatabase.instance().add_jobs(event.db_id, jobs)
+    for kind, due in jobs:
+        event_scheduler.schedule(due, event.db_id, event.chat_id, kind)
+
+
+async def run_event_job(bot, kind, chat_id, event_id):
+    """Perform scheduled action of event; called by EventScheduler"""
+    event = await EventCache.instance().event_by_id(chat_id, event_id)
+    if event is None:
+        return
+    if kind == "publish":
+        if not event.message_id and not is_closed(event):
+            await publish_event(bot, event)
+    elif kind == "remind":
+        if event.message_id and not is_closed(event):
+            joined = len(event.joined_players())
+            await bot.send_message(
+                chat_id,
+                f"Нагадування: {escape(event.title)} о {event.time.strftime('%H:%M')}, {escape(event.address)}. "
+                f"Гравців: {min(joined, event.players_limit)}/{event.players_limit}",
+                parse_mode="HTML",
+                reply_to_message_id=event.message_id,
+            )
+    elif kind == "close":
+        await render_event_message(bot, chat_id, event_id)
+
+
+@metrics.timed(metrics.HANDLER_SECONDS, handler="kt_create_event")
+async def kt_create_event(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # check if event with same address and same time already created
+    chat_id = update.message.chat_id
+    # defaults of chat template, built-in defaults if chat has no template
+    name = template_name(update.message.text)
+    template = TemplateCache.instance().get(chat_id, name)
+    if template is None and name != DEFAULT_TEMPLATE:
+        await update.message.reply_text(f"Шаблон {escape(name)} не знайдено", parse_mode="HTML")
+        return
+    new_event = bot_event.Event(update.message.text, prototype=template.prototype if template else None)
+    logger.info(f"NOTE: message text is {update.message.text}")
+    event = await EventCache.instance().find_conflict(chat_id, new_event)
+    if event is not None:
+        await update.message.reply_text(f"На цей час вже є запланована гра: {escape(event.address)} {event.time}",
+                                        parse_mode="HTML")
+        return
+    # store new event in database and create event message
+    await EventCache.instance().add_event(new_event, update.message.chat_id)
+    if new_event.message_time > time.time():
+        await schedule_event_jobs(new_event)
+        await update.message.reply_text(f"Гру буде опубліковано {new_event.publish_time.strftime('%d-%m-%Y %H:%M')}")
+        return
+    try:
+        await publish_event(context.bot, new_event)
+    except Exception as e:
+        # stored event is never left without jobs: "publish" job posts it later
+        logger.error(f"Unable to publish event {new_event.db_id} in chat {chat_id}: {repr(e)}")
+        await schedule_event_jobs(new_event, time.time() + PUBLISH_RETRY_DELAY)
+        await update.message.reply_text("Не вдалося опублікувати гру, повторна спроба за хвилину")
+        return
+    await schedule_event_jobs(new_event)
+
+@metrics.timed(metrics.HANDLER_SECONDS, handler="button")
 async def button(update, context):
     """Process clicking buttons for EVENT (register/unregister player)"""
     chat_id = update.effective_message.chat_id
     msg_id = update.effective_message.id
-    data = update.callback_query.data
-    await context.bot.send_message(chat_id, f"Pressed: {data} in {chat_id} MESSAGE_ID={msg_id}")
-    await update.callback_query.answer()
+    query = update.callback_query
+    logger.debug(f"Pressed: {query.data} in {chat_id} MESSAGE_ID={msg_id}")
+    action, event_id, version = parse_callback_data(query.data)
+    event = None
+    if event_id is not None:
+        event = await EventCache.instance().event_by_id(chat_id, event_id)
+    if event is None:
+        # buttons created before event id was added to callback data,
+        # or event got new id when chat was moved to another shard
+        event = await EventCache.instance().event_by_message(chat_id, msg_id)
+    if event is not None and version is not None and (event.message_id != msg_id or event.version_tag() != version):
+        # click on older version of event message
+        event = None
+    if event is None:
+        await query.answer()
+        return
+    if is_closed(event):
+        await query.answer("Запис на гру закрито")
+        return
+    user = query.from_user
+    if action == 'ADD' and BanList.instance().is_banned(chat_id, user.id):
+        await query.answer("Вас заблоковано в цьому чаті")
+        return
+    state = bot_db.FootballBotDatabase.STATE_JOINED if action == 'ADD' else bot_db.FootballBotDatabase.STATE_NOT_GOING
+    member = await EventCache.instance().add_member(event, user.id, user.full_name, user.username, state)
+    # clicks are merged: message is edited once per time window
+    message_updater.mark_dirty(chat_id, event.db_id)
+    if member.position is None:
+        await query.answer("Ви не йдете на гру")
+    elif member.in_queue:
+        # place in queue, counted after main list
+        await query.answer(f"Ви в черзі: {member.position - int(event.players_limit)}")
+    else:
+        await query.answer(f"Ви в основному складі: {member.position}")
 
 
-def main() -> None:
-    logging.basicConfig(filename="kt_football_bot.log", level=logging.INFO)
+async def is_chat_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    """Sender of command is administrator of chat"""
+    if update.effective_chat.type == "private":
+        return True
+    member = await context.bot.get_chat_member(update.effective_chat.id, update.effective_user.id)
+    return member.status in ("administrator", "creator")
 
-    credentials_file = "credentials.json"
-    if len(sys.argv) > 1:
-        credentials_file = sys.argv[1]
-    if not os.path.exists(credentials_file):
-        logging.error(
-            f"Unable to find {credentials_file} with Telegram bot token. Provide file name as first argument to script"
-        )
+
+async def ban_target(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    User of ban command: author of replied message, or first argument - user id or @username of event member
+    :return: (user_id, name, remaining arguments) or (None, None, arguments)
+    """
+    args = list(context.args or [])
+    reply = update.message.reply_to_message
+    if reply is not None and reply.from_user is not None:
+        return reply.from_user.id, reply.from_user.full_name, args
+    if not args:
+        return None, None, args
+    target = args.pop(0)
+    if target.lstrip("-").isdigit():
+        return int(target), target, args
+    row = await bot_db.FootballBotDatabase.instance().find_chat_user(update.effective_chat.id, target.lstrip("@"))
+    if row is None:
+        return None, None, args
+    return row[0], row[1], args
+
+
+async def refresh_chat_rosters(chat_id):
+    """Reload rosters of chat events after ban list was changed and re-render their messages"""
+    for event in await EventCache.instance().reload_players(chat_id):
+        message_updater.mark_dirty(chat_id, event.db_id)
+
+
+@metrics.timed(metrics.HANDLER_SECONDS, handler="kt_ban")
+async def kt_ban(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/kt_ban <@username|user id> [days] or reply /kt_ban [days] - ban user in chat, permanently without days"""
+    if not await is_chat_admin(update, context):
+        await update.message.reply_text("Команда доступна лише адміністраторам чату")
         return
+    chat_id = update.effective_chat.id
+    user_id, name, args = await ban_target(update, context)
+    if user_id is None:
+        await update.message.reply_text("Вкажіть гравця: відповідь на його повідомлення, @username або id")
+        return
+    end_timestamp = None
+    if args:
+        try:
+            end_timestamp = time.time() + float(args[0]) * 86400
+        except ValueError:
+            await update.message.reply_text("Кількість днів має бути числом")
+            return
+    await BanList.instance().ban(chat_id, user_id, end_timestamp)
+    await refresh_chat_rosters(chat_id)
+    until = "назавжди" if end_timestamp is None else f"до {time.strftime('%d-%m-%Y %H:%M', time.localtime(end_timestamp))}"
+    await update.message.reply_text(f"Гравця {name} заблоковано {until}")
 
-    with open(credentials_file) as f:
-        credentials = json.loads(f.read())
-    token = credentials["tg_bot_token"]
-    app = ApplicationBuilder().token(token).build()
+
+@metrics.timed(metrics.HANDLER_SECONDS, handler="kt_unban")
+async def kt_unban(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/kt_unban <@username|user id> or reply /kt_unban - remove ban of user in chat"""
+    if not await is_chat_admin(update, context):
+        await update.message.reply_text("Команда доступна лише адміністраторам чату")
+        return
+    chat_id = update.effective_chat.id
+    user_id, name, _ = await ban_target(update, context)
+    if user_id is None or not await BanList.instance().unban(chat_id, user_id):
+        await update.message.reply_text("Гравець не заблокований")
+        return
+    await refresh_chat_rosters(chat_id)
+    await update.message.reply_text(f"Гравця {name} розблоковано")
+
+
+@metrics.timed(metrics.HANDLER_SECONDS, handler="kt_stats")
+async def kt_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/kt_stats [N] - attendance of N most active players of chat (20 by default)"""
+    args = context.args or []
+    limit = min(int(args[0]), 100) if args and args[0].isdigit() and int(args[0]) > 0 else 20
+    rows = await bot_db.FootballBotDatabase.instance().get_player_stats(update.effective_chat.id, limit)
+    if not rows:
+        await update.message.reply_text("Статистики ще немає")
+        return
+    text = "Статистика гравців (ігор / у черзі / не прийшли / реакція):"
+    # lines which do not fit into one Telegram message are dropped, as in roster of event message
+    max_length = bot_event.Event.MESSAGE_LIMIT - bot_event.Event.TRUNCATION_RESERVE
+    for index, (_, _, name, username, games, queued, no_shows, reaction, _) in enumerate(rows):
+        login = f" ({escape(username)})" if username else ""
+        reaction_text = f"{reaction:.1f} сек" if reaction is not None else "-"
+        line = f"\n{index + 1}. {escape(str(name))}{login}: {games} / {queued} / {no_shows} / {reaction_text}"
+        if len((text + line).encode("utf-16-le")) // 2 > max_length:
+            text += f"\n... та ще {len(rows) - index}"
+            break
+        text += line
+    await update.message.reply_text(text, parse_mode="HTML")
+
+
+def command_params(update: Update) -> str:
+    """Text of command message after command name"""
+    return update.message.text.partition(" ")[2].strip()
+
+
+@metrics.timed(metrics.HANDLER_SECONDS, handler="kt_template")
+async def kt_template(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    /kt_template - list templates of chat
+    /kt_template [name] title=...; time=...; address=...; limit=...; weekdays=вт,чт; publish_before=48 -
+        save template ("default" if name is not given; used by /kt_add_event without template=)
+    """
+    chat_id = update.effective_chat.id
+    params = command_params(update)
+    if not params:
+        templates = TemplateCache.instance().templates(chat_id)
+        text = "\n".join(t.describe() for t in templates) if templates else "Шаблонів немає"
+        await update.message.reply_text(text)
+        return
+    if not await is_chat_admin(update, context):
+        await update.message.reply_text("Команда доступна лише адміністраторам чату")
+        return
+    name = DEFAULT_TEMPLATE
+    first, _, rest = params.partition(" ")
+    if "=" not in first and ":" not in first:
+        name, params = first, rest.strip()
+    if EventTemplate(name, params).prototype.publish_time is not None:
+        # publish= is time of one message; events of template are published publish_before hours before start
+        await update.message.reply_text("Шаблон не може містити publish=, використовуйте publish_before=<годин>")
+        return
+    template = await TemplateCache.instance().save(chat_id, name, params)
+    example = template.create_event()
+    await update.message.reply_text(f"Шаблон {name} збережено. Приклад: {example.title}, {example.address}, "
+                                    f"{example.time.strftime('%d-%m-%Y %H:%M')}, гравців {example.players_limit}")
+
+
+@metrics.timed(metrics.HANDLER_SECONDS, handler="kt_template_delete")
+async def kt_template_delete(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/kt_template_delete [name] - remove template of chat"""
+    if not await is_chat_admin(update, context):
+        await update.message.reply_text("Команда доступна лише адміністраторам чату")
+        return
+    name = command_params(update) or DEFAULT_TEMPLATE
+    if await TemplateCache.instance().delete(update.effective_chat.id, name):
+        await update.message.reply_text(f"Шаблон {name} видалено")
+    else:
+        await update.message.reply_text(f"Шаблону {name} немає")
+
+
+@metrics.timed(metrics.HANDLER_SECONDS, handler="kt_schedule")
+async def kt_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    /kt_schedule [name] [weeks] - create events of recurring template for next weeks (1 by default);
+    events which already exist are skipped
+    """
+    if not await is_chat_admin(update, context):
+        await update.message.reply_text("Команда доступна лише адміністраторам чату")
+        return
+    chat_id = update.effective_chat.id
+    args = list(context.args or [])
+    weeks = int(args.pop()) if args and args[-1].isdigit() else 1
+    name = args[0] if args else DEFAULT_TEMPLATE
+    template = TemplateCache.instance().get(chat_id, name)
+    if template is None or not template.weekdays:
+        await update.message.reply_text(f"Шаблон {name} не має днів тижня (weekdays=вт,чт)")
+        return
+    cache = EventCache.instance()
+    events = [e for e in template.recurring_events(min(weeks, 12)) if await cache.find_conflict(chat_id, e) is None]
+    if events:
+        await cache.add_events(events, chat_id)
+        for event in events:
+            if event.publish_time is None:
+                await publish_event(context.bot, event)
+            await schedule_event_jobs(event)
+    await update.message.reply_text(
+        f"Створено ігор: {len(events)}" +
+        "".join(f"\n{e.time.strftime('%a %d-%m-%Y %H:%M')}" for e in events)
+    )
+
+
+async def post_init(app) -> None:
+    """Upgrade database and start background tasks in event loop of application; runs before webhook is started"""
+    global message_updater, event_scheduler
+    await bot_db.FootballBotDatabase.instance().migrate()
+    await ProcessedUpdates.instance().start()
+    message_updater = MessageUpdater(lambda chat_id, event_id: render_event_message(app.bot, chat_id, event_id),
+                                     **message_updater_options)
+    message_updater.start()
+    event_scheduler = EventScheduler(lambda kind, chat_id, event_id: run_event_job(app.bot, kind, chat_id, event_id))
+    await event_scheduler.start()
+    await BanList.instance().start(refresh_chat_rosters)
+    await TemplateCache.instance().load()
+    if retention is not None:
+        retention.start()
+    if metrics_server is not None:
+        await metrics_server.start()
+
+
+async def post_stop(app) -> None:
+    """Stop background tasks; called on stop signals"""
+    if event_scheduler is not None:
+        await event_scheduler.stop()
+    await BanList.instance().stop()
+    if retention is not None:
+        await retention.stop()
+    if message_updater is not None:
+        await message_updater.stop()
+    if metrics_server is not None:
+        await metrics_server.stop()
+    await ProcessedUpdates.instance().stop()
+    # commit writes pending in write-behind mode
+    await bot_db.FootballBotDatabase.instance().close()
+
+
+def build_application(token: str, updater: bool = True, api_url: str = None):
+    """
+    Create Telegram application with all bot handlers
+    :param api_url: Bot API base URL (for local Bot API server), None for api.telegram.org
+    """
+    builder = (ApplicationBuilder().token(token).request(metrics.InstrumentedRequest())
+               .post_init(post_init).post_stop(post_stop))
+    if api_url:
+        builder = builder.base_url(api_url)
+    if not updater:
+        # updates are passed to process_update() by caller
+        builder = builder.updater(None)
+    app = builder.build()
+    app.add_handler(TypeHandler(Update, drop_duplicate), group=-2)
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("kt_add_event", kt_create_event))
+    app.add_handler(CommandHandler("kt_ban", kt_ban))
+    app.add_handler(CommandHandler("kt_unban", kt_unban))
+    app.add_handler(CommandHandler("kt_template", kt_template))
+    app.add_handler(CommandHandler("kt_template_delete", kt_template_delete))
+    app.add_handler(CommandHandler("kt_schedule", kt_schedule))
+    app.add_handler(CommandHandler("kt_stats", kt_stats))
     app.add_handler(CallbackQueryHandler(button))
-    logging.info("Run Telegram Bot webhook...")
+    return app
+
+
+def configure(credentials: dict, db_path: str = None, metrics_port: int = None) -> None:
+    """
+    Create global services of bot from configuration
+    :param db_path: database file, by default "db_path" from configuration
+    :param metrics_port: port of metrics endpoint, by default "metrics_port" from configuration
+    """
+    # metrics in Prometheus text format; "metrics_port": 0 disables endpoint
+    global metrics_server
+    if metrics_port is None:
+        metrics_port = credentials["metrics_port"] if "metrics_port" in credentials else 9091
+    if metrics_port:
+        metrics_server = metrics.MetricsServer(
+            credentials["metrics_addr"] if "metrics_addr" in credentials else "127.0.0.1", metrics_port
+        )
+
+    # events at the same address closer than this interval (seconds) are duplicates
+    EventCache.instance(credentials["event_conflict_window"] if "event_conflict_window" in credentials else 3600)
+
+    # re-render of event messages: clicks collected before edit, minimal interval between edits in chat, seconds
+    global message_updater_options
+    message_updater_options = {}
+    if "edit_coalesce_window" in credentials:
+        message_updater_options["coalesce_window"] = float(credentials["edit_coalesce_window"])
+    if "edit_chat_interval" in credentials:
+        message_updater_options["chat_interval"] = float(credentials["edit_chat_interval"])
+    # edits per second of the whole bot token
+    if "edit_global_rate" in credentials:
+        message_updater_options["global_rate"] = float(credentials["edit_global_rate"])
+
+    global remind_before
+    remind_before = float(credentials["remind_before"]) if "remind_before" in credentials else 7200
+
+    # finished events are moved to archive database this many seconds after event time; 0 - keep in live tables
+    global retention
+    archive_after = float(credentials["archive_after"]) if "archive_after" in credentials else 30 * 86400
+    retention = Retention(
+        # events are cached for some hours after start: they are never archived earlier than in a day
+        max(archive_after, 86400) if archive_after > 0 else 0,
+        float(credentials["maintenance_period"]) if "maintenance_period" in credentials else 86400,
+    )
 
     # init database
-    bot_db.FootballBotDatabase.instance(credentials["db_path"] if "db_path" in credentials else "kt_football.db")
+    archive_path = None
+    if db_path is None:
+        db_path = credentials["db_path"] if "db_path" in credentials else "kt_football.db"
+        # shards always use archive file next to their database
+        archive_path = credentials["archive_path"] if "archive_path" in credentials else None
+    bot_db.FootballBotDatabase.instance(
+        db_path,
+        # group commit window, seconds; 0 to commit every write immediately
+        credentials["db_commit_delay"] if "db_commit_delay" in credentials else 0.1,
+        archive_path,
+    )
 
-    # run background task for updating messages
-    # global current_periodic_task
-    # if current_periodic_task is None:
-    #     event_loop = asyncio.get_event_loop()
-    #     current_periodic_task = event_loop.create_task(regular_task())
 
-    app.run_webhook(
+def webhook_options(credentials: dict) -> dict:
+    """Parameters of run_webhook() from configuration"""
+    return dict(
         listen=credentials["web_addr"] if "web_addr" in credentials else "0.0.0.0",
         port=credentials["web_port"] if "web_addr" in credentials else 80,
         # url_path=credentials["web_path"],
@@ -128,8 +543,34 @@ def main() -> None:
         stop_signals=[signal.SIGTERM, signal.SIGINT],
         secret_token=credentials["web_hook_token"],
     )
-    # if current_periodic_task is None:
-    #     current_periodic_task.cancel()
+
+
+def main() -> None:
+    logging.basicConfig(filename="kt_football_bot.log", level=logging.INFO)
+
+    credentials_file = "credentials.json"
+    if len(sys.argv) > 1:
+        credentials_file = sys.argv[1]
+    if not os.path.exists(credentials_file):
+        logging.error(
+            f"Unable to find {credentials_file} with Telegram bot token. Provide file name as first argument to script"
+        )
+        return
+
+    with open(credentials_file) as f:
+        credentials = json.loads(f.read())
+
+    if "shards" in credentials and int(credentials["shards"]) > 1:
+        # chats are partitioned between worker processes; this process only routes updates
+        import sharding
+        sharding.run_front(credentials)
+        return
+
+    app = build_application(credentials["tg_bot_token"],
+                            api_url=credentials["tg_api_url"] if "tg_api_url" in credentials else None)
+    configure(credentials)
+    logging.info("Run Telegram Bot webhook...")
+    app.run_webhook(**webhook_options(credentials))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,151 @@
+"""
+Coalescing re-render scheduler for event messages of KT Football bot
+©Viktor Sharov, 2024
+"""
+
+import asyncio
+import datetime
+import logging
+import time
+
+from telegram.error import BadRequest, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+
+class MessageUpdater:
+    """
+    Collects "dirty" event messages and re-renders each of them at most once per time window.
+    Button click only marks message as dirty; edits are dispatched by single background task
+    which respects Telegram rate limits:
+      - per chat: not more than one edit per `chat_interval` seconds (groups allow 20 messages per minute)
+      - global: not more than `global_rate` requests per second
+    Edits run concurrently, so throughput is limited by the rate, not by round trip of Bot API request
+    """
+
+    def __init__(self, render, coalesce_window: float = 1.0, chat_interval: float = 3.0, global_rate: float = 30,
+                 max_in_flight: int = 30):
+        """
+        :param render: coroutine function render(chat_id, key) which sends actual edit request to Telegram
+        :param coalesce_window: seconds to collect clicks on the same message before re-render
+        :param chat_interval: minimal interval between two edits in the same chat, seconds
+        :param global_rate: maximal count of edits per second for all chats
+        :param max_in_flight: maximal count of edits waiting for Bot API response
+        """
+        self.__render = render
+        self.__coalesce_window = coalesce_window
+        self.__chat_interval = chat_interval
+        self.__global_interval = 1.0 / global_rate
+        # (chat_id, key) -> monotonic time when item became dirty; dict keeps FIFO order
+        self.__dirty = {}
+        # chat_id -> monotonic time when next edit in this chat is allowed
+        self.__chat_ready = {}
+        self.__global_ready = 0.0
+        self.__max_in_flight = max_in_flight
+        # (chat_id, key) -> task of edit waiting for response; message is not edited by two requests at once
+        self.__in_flight = {}
+        self.__wakeup = asyncio.Event()
+        self.__task = None
+        self.__stopped = False
+
+    def mark_dirty(self, chat_id: int, key):
+        """
+        Schedule re-render of message. Repeated calls for already dirty message are merged
+        :param chat_id: Telegram chat id
+        :param key: message identifier passed to render function
+        """
+        item = (chat_id, key)
+        if item not in self.__dirty:
+            self.__dirty[item] = time.monotonic()
+            self.__wakeup.set()
+
+    def pending(self) -> int:
+        return len(self.__dirty)
+
+    def start(self):
+        """Start background task in current event loop"""
+        if self.__task is None:
+            self.__stopped = False
+            self.__task = asyncio.get_running_loop().create_task(self.__run())
+
+    async def stop(self, flush: bool = True):
+        """
+        Stop background task
+        :param flush: True to send all pending edits before return
+        """
+        self.__stopped = True
+        self.__wakeup.set()
+        if self.__task is not None:
+            await self.__task
+            self.__task = None
+        if self.__in_flight:
+            await asyncio.gather(*self.__in_flight.values(), return_exceptions=True)
+        if flush:
+            for item in list(self.__dirty):
+                del self.__dirty[item]
+                await self.__send(item)
+
+    async def __run(self):
+        while not self.__stopped:
+            self.__wakeup.clear()
+            now = time.monotonic()
+            timeout = None
+            for item, dirty_since in list(self.__dirty.items()):
+                # completion of edit wakes up the loop
+                if len(self.__in_flight) >= self.__max_in_flight:
+                    break
+                if item in self.__in_flight:
+                    continue
+                ready = max(dirty_since + self.__coalesce_window,
+                            self.__chat_ready.get(item[0], 0.0),
+                            self.__global_ready)
+                if ready > now:
+                    timeout = ready - now if timeout is None else min(timeout, ready - now)
+                    continue
+                # item is removed before render: click during render marks message dirty again
+                del self.__dirty[item]
+                self.__reserve(item[0])
+                task = asyncio.get_running_loop().create_task(self.__render_item(item))
+                self.__in_flight[item] = task
+                task.add_done_callback(lambda t, i=item: self.__done(i))
+                # global limit may postpone the rest of items
+                if self.__global_ready > now:
+                    timeout = self.__global_ready - now
+                    break
+            if not self.__dirty:
+                self.__chat_ready = {k: v for k, v in self.__chat_ready.items() if v > now}
+            try:
+                await asyncio.wait_for(self.__wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def __done(self, item):
+        self.__in_flight.pop(item, None)
+        self.__wakeup.set()
+
+    def __reserve(self, chat_id):
+        """Take slot of global and chat rate limits for edit sent now"""
+        now = time.monotonic()
+        self.__global_ready = max(now, self.__global_ready) + self.__global_interval
+        self.__chat_ready[chat_id] = now + self.__chat_interval
+
+    async def __send(self, item):
+        self.__reserve(item[0])
+        await self.__render_item(item)
+
+    async def __render_item(self, item):
+        chat_id, key = item
+        try:
+            await self.__render(chat_id, key)
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if isinstance(retry_after, datetime.timedelta):
+                retry_after = retry_after.total_seconds()
+            logger.warning(f"Flood control in chat {chat_id}: retry in {retry_after} seconds")
+            self.__chat_ready[chat_id] = time.monotonic() + float(retry_after)
+            self.__dirty.setdefault(item, time.monotonic())
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                logger.error(f"Unable to update message {key} in chat {chat_id}: {e}")
+        except Exception as e:
+            logger.error(f"Unable to update message {key} in chat {chat_id}: {repr(e)}")
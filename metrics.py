@@ -0,0 +1,188 @@
+"""
+Hot-path instrumentation for KT Football bot
+Latency histograms and counters of handlers, database methods, Telegram API calls and event loop lag,
+exposed in Prometheus text format on local HTTP endpoint
+©Viktor Sharov, 2024
+"""
+
+import asyncio
+import bisect
+import functools
+import logging
+import time
+
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of histogram buckets, seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HANDLER_SECONDS = "kt_handler_seconds"
+DB_SECONDS = "kt_db_seconds"
+TELEGRAM_API_SECONDS = "kt_telegram_api_seconds"
+EVENT_LOOP_LAG_SECONDS = "kt_event_loop_lag_seconds"
+ERRORS_TOTAL = "kt_errors_total"
+DUPLICATE_UPDATES_TOTAL = "kt_duplicate_updates_total"
+
+_HELP = {
+    HANDLER_SECONDS: "Latency of Telegram update handlers",
+    DB_SECONDS: "Latency of FootballBotDatabase methods",
+    TELEGRAM_API_SECONDS: "Latency of outgoing Telegram Bot API calls",
+    EVENT_LOOP_LAG_SECONDS: "Delay of event loop wakeups",
+    ERRORS_TOTAL: "Count of exceptions in instrumented calls",
+    DUPLICATE_UPDATES_TOTAL: "Count of dropped repeated Telegram updates",
+}
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets; observe() is O(log buckets)"""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+# (metric name, labels) -> Histogram; labels is tuple of (name, value)
+_histograms = {}
+# (metric name, labels) -> int
+_counters = {}
+
+
+def histogram(metric_name: str, **labels) -> Histogram:
+    key = (metric_name, tuple(sorted(labels.items())))
+    item = _histograms.get(key)
+    if item is None:
+        item = _histograms[key] = Histogram()
+    return item
+
+
+def inc(metric_name: str, **labels):
+    key = (metric_name, tuple(sorted(labels.items())))
+    _counters[key] = _counters.get(key, 0) + 1
+
+
+def timed(metric: str, **labels):
+    """
+    Decorator for coroutine function: records its latency in histogram and counts exceptions
+    """
+    def decorator(func):
+        hist = histogram(metric, **labels)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                inc(ERRORS_TOTAL, metric=metric, **labels)
+                raise
+            finally:
+                hist.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTP request backend of bot which records every Bot API call"""
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        start = time.perf_counter()
+        try:
+            return await super().do_request(url, method, request_data, **kwargs)
+        except Exception:
+            inc(ERRORS_TOTAL, metric=TELEGRAM_API_SECONDS, method=api_method)
+            raise
+        finally:
+            histogram(TELEGRAM_API_SECONDS, method=api_method).observe(time.perf_counter() - start)
+
+
+def render() -> str:
+    """All metrics in Prometheus text exposition format"""
+    lines = []
+    described = set()
+
+    def describe(metric, metric_type):
+        if metric not in described:
+            described.add(metric)
+            lines.append(f"# HELP {metric} {_HELP.get(metric, metric)}")
+            lines.append(f"# TYPE {metric} {metric_type}")
+
+    for (metric, labels), item in sorted(_histograms.items()):
+        describe(metric, "histogram")
+        label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+        prefix = label_text + "," if label_text else ""
+        cumulative = 0
+        for bound, count in zip(BUCKETS, item.counts):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+        lines.append(f'{metric}_bucket{{{prefix}le="+Inf"}} {item.count}')
+        labels_text = f"{{{label_text}}}" if label_text else ""
+        lines.append(f"{metric}_sum{labels_text} {item.sum:.6f}")
+        lines.append(f"{metric}_count{labels_text} {item.count}")
+    for (metric, labels), value in sorted(_counters.items()):
+        describe(metric, "counter")
+        label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+        labels_text = f"{{{label_text}}}" if label_text else ""
+        lines.append(f"{metric}{labels_text} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+    Local HTTP endpoint with metrics (any path) and event loop lag monitor
+    """
+
+    # how often event loop lag is measured, seconds
+    LAG_INTERVAL = 0.5
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9091):
+        self.__host = host
+        self.__port = port
+        self.__server = None
+        self.__lag_task = None
+
+    async def start(self):
+        self.__server = await asyncio.start_server(self.__client, self.__host, self.__port)
+        self.__lag_task = asyncio.get_running_loop().create_task(self.__monitor_lag())
+        logger.info(f"Metrics endpoint: http://{self.__host}:{self.__port}/metrics")
+
+    async def stop(self):
+        if self.__lag_task is not None:
+            self.__lag_task.cancel()
+            self.__lag_task = None
+        if self.__server is not None:
+            self.__server.close()
+            await self.__server.wait_closed()
+            self.__server = None
+
+    async def __monitor_lag(self):
+        lag = histogram(EVENT_LOOP_LAG_SECONDS)
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.LAG_INTERVAL)
+            lag.observe(max(0.0, time.perf_counter() - start - self.LAG_INTERVAL))
+
+    @staticmethod
+    async def __client(reader, writer):
+        try:
+            # request line and headers are ignored: the only resource is metrics
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            payload = render().encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         b"Content-Length: " + str(len(payload)).encode() + b"\r\nConnection: close\r\n\r\n" + payload)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
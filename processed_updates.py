@@ -0,0 +1,119 @@
+"""
+Deduplication of Telegram updates for KT Football bot
+©Viktor Sharov, 2024
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from telegram import Update
+
+from database import FootballBotDatabase
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessedUpdates:
+    """
+    Keys of recently processed updates: update_id and id of callback query.
+    Check is done in bounded LRU in memory; keys are written to `processed_update` table in batches
+    in background and loaded back at start, so webhook retries are recognized after restart too.
+    """
+
+    #global instance
+    global_instance = None
+
+    # delay of batch write of new keys, seconds
+    WRITE_DELAY = 0.1
+    # keys are kept in database this long, seconds: Telegram does not re-send updates older than a day
+    KEEP = 86400
+    # how often old keys are removed from database, seconds
+    PURGE_PERIOD = 3600
+
+    def __init__(self, capacity: int = 20000):
+        """
+        :param capacity: count of keys kept in memory
+        """
+        self.__capacity = capacity
+        # key -> None, least recently seen first
+        self.__keys = OrderedDict()
+        # (key, timestamp) not written to database yet
+        self.__pending = []
+        self.__write_task = None
+        self.__purge_task = None
+
+    async def start(self):
+        """Load recent keys from database and start purge task in current event loop"""
+        db = FootballBotDatabase.instance()
+        await db.purge_processed_updates(time.time() - self.KEEP)
+        self.__keys = OrderedDict.fromkeys(await db.get_processed_updates(self.__capacity))
+        logger.info(f"Loaded {len(self.__keys)} processed update keys")
+        if self.__purge_task is None:
+            self.__purge_task = asyncio.get_running_loop().create_task(self.__purge())
+
+    async def stop(self):
+        """Write pending keys; called before database is closed"""
+        for task in (self.__purge_task, self.__write_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self.__purge_task = None
+        self.__write_task = None
+        await self.__write()
+
+    def is_duplicate(self, update: Update) -> bool:
+        """
+        Remember keys of update
+        :return: True if update or its callback query was already seen
+        """
+        keys = [f"u{update.update_id}"]
+        if update.callback_query is not None:
+            keys.append(f"q{update.callback_query.id}")
+        duplicate = False
+        for key in keys:
+            if key in self.__keys:
+                self.__keys.move_to_end(key)
+                duplicate = True
+        if duplicate:
+            return True
+        now = time.time()
+        for key in keys:
+            self.__keys[key] = None
+            self.__pending.append((key, now))
+        while len(self.__keys) > self.__capacity:
+            self.__keys.popitem(last=False)
+        if self.__write_task is None:
+            self.__write_task = asyncio.get_running_loop().create_task(self.__delayed_write())
+        return False
+
+    async def __delayed_write(self):
+        await asyncio.sleep(self.WRITE_DELAY)
+        self.__write_task = None
+        try:
+            await self.__write()
+        except Exception as e:
+            logger.error(f"Unable to store processed update keys: {repr(e)}")
+
+    async def __write(self):
+        if self.__pending:
+            rows, self.__pending = self.__pending, []
+            await FootballBotDatabase.instance().add_processed_updates(rows)
+
+    async def __purge(self):
+        while True:
+            await asyncio.sleep(self.PURGE_PERIOD)
+            try:
+                await FootballBotDatabase.instance().purge_processed_updates(time.time() - self.KEEP)
+            except Exception as e:
+                logger.error(f"Purge of processed update keys failed: {repr(e)}")
+
+    @staticmethod
+    def instance(capacity: int = 20000) -> "ProcessedUpdates":
+        if ProcessedUpdates.global_instance is None:
+            ProcessedUpdates.global_instance = ProcessedUpdates(capacity)
+        return ProcessedUpdates.global_instance
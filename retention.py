@@ -0,0 +1,82 @@
+"""
+Data retention of KT Football bot: archival of finished events and database maintenance
+©Viktor Sharov, 2024
+"""
+
+import asyncio
+import logging
+import time
+
+from database import FootballBotDatabase
+
+logger = logging.getLogger(__name__)
+
+
+class Retention:
+    """
+    Background task which keeps live tables small: once per period it adds finished events to player
+    statistics, moves events finished more than `archive_after` seconds ago with their members
+    to archive database, then runs incremental vacuum and analyze.
+    Events are moved in small batches, so writes of handlers are not blocked for long.
+    """
+
+    # delay of the first run after start, seconds: startup is not slowed down by maintenance
+    START_DELAY = 60
+    # events moved in one transaction
+    BATCH_SIZE = 500
+
+    def __init__(self, archive_after: float = 30 * 86400, period: float = 86400):
+        """
+        :param archive_after: finished events older than this (seconds after event time) are archived; 0 - never
+        :param period: interval between maintenance runs, seconds
+        """
+        self.__archive_after = archive_after
+        self.__period = period
+        self.__task = None
+
+    def start(self):
+        """Start background task in current event loop"""
+        if self.__task is None:
+            self.__task = asyncio.get_running_loop().create_task(self.__run())
+
+    async def stop(self):
+        if self.__task is not None:
+            self.__task.cancel()
+            try:
+                await self.__task
+            except asyncio.CancelledError:
+                pass
+            self.__task = None
+
+    async def __run(self):
+        await asyncio.sleep(self.START_DELAY)
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Database maintenance failed: {repr(e)}")
+            await asyncio.sleep(self.__period)
+
+    async def run_once(self) -> int:
+        """
+        Summarize and archive finished events and optimize database
+        :return: count of archived events
+        """
+        db = FootballBotDatabase.instance()
+        # finished events are added to player statistics before they leave live tables
+        now = time.time()
+        while not await db.summarize_stats(now):
+            await asyncio.sleep(0)
+        archived = 0
+        if self.__archive_after > 0:
+            before = time.time() - self.__archive_after
+            while True:
+                count = await db.archive_events(before, self.BATCH_SIZE)
+                archived += count
+                if count < self.BATCH_SIZE:
+                    break
+                # let handlers use database between batches
+                await asyncio.sleep(0)
+        await db.optimize()
+        logger.info(f"Database maintenance: {archived} events archived")
+        return archived
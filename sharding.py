@@ -0,0 +1,286 @@
+"""
+Sharded deployment of KT Football bot: chats are partitioned between worker processes
+Front process receives webhook updates and routes each update to worker which owns the chat;
+every worker has its own database shard, cache and background tasks.
+Updates of one chat are processed in order; different chats are processed concurrently.
+©Viktor Sharov, 2024
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import zlib
+
+from telegram import Update
+from telegram.ext import ApplicationBuilder, ApplicationHandlerStop, CommandHandler, TypeHandler
+
+import database as bot_db
+import kt_football_bot as bot_main
+from ban_list import BanList
+from event_cache import EventCache
+from templates import TemplateCache
+
+logger = logging.getLogger(__name__)
+
+# primary keys of shard N start from N * SHARD_ID_SPACE: ids of events are unique between shards
+SHARD_ID_SPACE = 1 << 40
+
+
+def shard_for_chat(chat_id: int, shards: int, overrides: dict) -> int:
+    """
+    :param overrides: chat_id -> shard for chats moved from their hash shard
+    :return: index of shard which owns chat
+    """
+    shard = overrides.get(chat_id)
+    if shard is None:
+        shard = zlib.crc32(str(chat_id).encode()) % shards
+    return shard
+
+
+def shard_db_path(credentials: dict, index: int) -> str:
+    db_path = credentials["db_path"] if "db_path" in credentials else "kt_football.db"
+    root, ext = os.path.splitext(db_path)
+    return f"{root}.shard{index}{ext}"
+
+
+class ShardRouter:
+    """
+    Front side of sharded deployment: starts workers and passes updates to them.
+    Messages to worker: ("update", chat_id, update_json), ("export", chat_id), ("import", chat_id, rows),
+        ("delete", chat_id), ("release", chat_id), ("stop",)
+    Messages from workers: ("exported", chat_id, rows or None on error), ("imported", chat_id, success)
+    """
+
+    # max wait of one step of chat move for worker reply, seconds
+    MOVE_TIMEOUT = 60
+
+    def __init__(self, credentials: dict):
+        self.__credentials = credentials
+        self.__shards = int(credentials["shards"])
+        self.__map_file = credentials["shard_map"] if "shard_map" in credentials else "kt_football_shards.json"
+        self.__overrides = {}
+        if os.path.exists(self.__map_file):
+            with open(self.__map_file) as f:
+                self.__overrides = {int(k): int(v) for k, v in json.loads(f.read()).items()}
+        self.__context = multiprocessing.get_context("spawn")
+        self.__inboxes = []
+        self.__outbox = None
+        self.__processes = []
+        self.__reader_task = None
+        # chat_id -> updates received while chat is moving between shards
+        self.__moving = {}
+        # (reply kind, chat_id) -> future
+        self.__waiting = {}
+
+    async def start(self, app):
+        self.__outbox = self.__context.Queue()
+        for index in range(self.__shards):
+            inbox = self.__context.Queue()
+            process = self.__context.Process(target=run_worker, name=f"kt_football_shard{index}",
+                                             args=(index, self.__credentials, inbox, self.__outbox))
+            process.start()
+            self.__inboxes.append(inbox)
+            self.__processes.append(process)
+        self.__reader_task = asyncio.get_running_loop().create_task(self.__read_replies())
+        logger.info(f"Started {self.__shards} shard workers")
+
+    async def stop(self, app):
+        for inbox in self.__inboxes:
+            inbox.put(("stop",))
+        loop = asyncio.get_running_loop()
+        for process in self.__processes:
+            await loop.run_in_executor(None, process.join)
+        if self.__reader_task is not None:
+            # wakes up reader blocked in queue
+            self.__outbox.put(("stopped", None))
+            await self.__reader_task
+            self.__reader_task = None
+
+    async def route(self, update: Update, context) -> None:
+        chat_id = update.effective_chat.id if update.effective_chat is not None else 0
+        message = ("update", chat_id, update.to_json())
+        if chat_id in self.__moving:
+            self.__moving[chat_id].append(message)
+        else:
+            self.__inboxes[shard_for_chat(chat_id, self.__shards, self.__overrides)].put(message)
+
+    async def move_chat(self, chat_id: int, target: int) -> bool:
+        """
+        Move chat with its data to another shard. Updates of chat are held until move is finished.
+        If a worker does not answer in MOVE_TIMEOUT seconds, move is rolled back and chat stays on source shard
+        :return: True if chat was moved
+        """
+        source = shard_for_chat(chat_id, self.__shards, self.__overrides)
+        if source == target or chat_id in self.__moving:
+            return False
+        self.__moving[chat_id] = []
+        imported = False
+        try:
+            # source processes all routed updates of chat before export
+            self.__send(source, ("export", chat_id))
+            rows = await self.__wait_reply("exported", chat_id)
+            if rows is None:
+                raise RuntimeError(f"shard {source} failed to export chat")
+            self.__send(target, ("import", chat_id, rows))
+            imported = True
+            if not await self.__wait_reply("imported", chat_id):
+                raise RuntimeError(f"shard {target} failed to import chat")
+            self.__overrides[chat_id] = target
+            with open(self.__map_file, "w") as f:
+                f.write(json.dumps(self.__overrides))
+        except Exception as e:
+            logger.error(f"Move of chat {chat_id} from shard {source} to shard {target} failed: {repr(e)}")
+            if imported and self.__processes[target].is_alive():
+                # import may still be running: delete is queued after it, target keeps no copy of chat
+                self.__inboxes[target].put(("delete", chat_id))
+            if self.__processes[source].is_alive():
+                # jobs held by export run on source again; queued after export if it is still running
+                self.__inboxes[source].put(("release", chat_id))
+            return False
+        finally:
+            held = self.__moving.pop(chat_id)
+            inbox = self.__inboxes[shard_for_chat(chat_id, self.__shards, self.__overrides)]
+            for message in held:
+                inbox.put(message)
+        # rows are removed from source only when target owns the chat
+        if self.__processes[source].is_alive():
+            self.__inboxes[source].put(("delete", chat_id))
+        else:
+            logger.error(f"Shard {source} is not running: rows of moved chat {chat_id} are left there")
+        logger.info(f"Chat {chat_id} moved from shard {source} to shard {target}")
+        return True
+
+    async def kt_move_chat(self, update: Update, context) -> None:
+        """Admin command: /kt_move_chat <shard> - move current chat to given shard"""
+        admins = self.__credentials["admin_ids"] if "admin_ids" in self.__credentials else []
+        if update.effective_user is not None and update.effective_user.id in admins:
+            try:
+                target = int(context.args[0])
+            except (IndexError, ValueError):
+                target = -1
+            if 0 <= target < self.__shards:
+                # move runs in background: updates of other chats are routed meanwhile
+                context.application.create_task(self.__move_and_reply(update, target), update=update)
+            else:
+                await update.message.reply_text(f"Вкажіть номер шарда від 0 до {self.__shards - 1}")
+            raise ApplicationHandlerStop()
+
+    async def __move_and_reply(self, update: Update, target: int):
+        if await self.move_chat(update.effective_chat.id, target):
+            await update.message.reply_text(f"Чат переміщено на шард {target}")
+        else:
+            await update.message.reply_text(f"Не вдалося перемістити чат на шард {target}")
+
+    def __send(self, index: int, message: tuple):
+        if not self.__processes[index].is_alive():
+            raise RuntimeError(f"shard {index} is not running")
+        self.__inboxes[index].put(message)
+
+    async def __wait_reply(self, kind: str, chat_id: int):
+        future = asyncio.get_running_loop().create_future()
+        self.__waiting[(kind, chat_id)] = future
+        try:
+            return await asyncio.wait_for(future, self.MOVE_TIMEOUT)
+        finally:
+            self.__waiting.pop((kind, chat_id), None)
+
+    async def __read_replies(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            reply = await loop.run_in_executor(None, self.__outbox.get)
+            if reply[0] == "stopped":
+                break
+            future = self.__waiting.pop((reply[0], reply[1]), None)
+            if future is not None and not future.done():
+                future.set_result(reply[2] if len(reply) > 2 else None)
+
+
+def run_front(credentials: dict) -> None:
+    """Run webhook in front process which routes updates to shard workers"""
+    router = ShardRouter(credentials)
+    app = (ApplicationBuilder().token(credentials["tg_bot_token"])
+           .post_init(router.start).post_stop(router.stop).build())
+    app.add_handler(CommandHandler("kt_move_chat", router.kt_move_chat), group=-1)
+    app.add_handler(TypeHandler(Update, router.route))
+    logging.info(f"Run Telegram Bot webhook with {credentials['shards']} shards...")
+    app.run_webhook(**bot_main.webhook_options(credentials))
+
+
+def run_worker(index: int, credentials: dict, inbox, outbox) -> None:
+    """Entry point of shard worker process"""
+    logging.basicConfig(filename=f"kt_football_bot.shard{index}.log", level=logging.INFO)
+    metrics_port = credentials["metrics_port"] if "metrics_port" in credentials else 9091
+    # workers share rate limit of one bot token
+    global_rate = float(credentials["edit_global_rate"]) if "edit_global_rate" in credentials else 30
+    worker_credentials = dict(credentials, edit_global_rate=global_rate / int(credentials["shards"]))
+    bot_main.configure(worker_credentials, db_path=shard_db_path(credentials, index),
+                       metrics_port=metrics_port + 1 + index if metrics_port else 0)
+    asyncio.run(_worker(index, credentials, inbox, outbox))
+
+
+async def _after(previous, coroutine):
+    if previous is not None:
+        # errors of previous update are reported by application; order is all that matters here
+        await asyncio.gather(previous, return_exceptions=True)
+    await coroutine
+
+
+async def _worker(index: int, credentials: dict, inbox, outbox):
+    app = bot_main.build_application(credentials["tg_bot_token"], updater=False,
+                                     api_url=credentials["tg_api_url"] if "tg_api_url" in credentials else None)
+    db = bot_db.FootballBotDatabase.instance()
+    await db.reserve_ids(index * SHARD_ID_SPACE + 1)
+    loop = asyncio.get_running_loop()
+    # chat_id -> task processing last update of chat
+    tails = {}
+
+    def chain(chat_id, coroutine):
+        task = loop.create_task(_after(tails.get(chat_id), coroutine))
+        tails[chat_id] = task
+        task.add_done_callback(lambda t: tails.pop(chat_id) if tails.get(chat_id) is t else None)
+
+    async with app:
+        await bot_main.post_init(app)
+        while True:
+            message = await loop.run_in_executor(None, inbox.get)
+            kind = message[0]
+            if kind == "stop":
+                break
+            chat_id = message[1]
+            if kind == "update":
+                update = Update.de_json(json.loads(message[2]), app.bot)
+                chain(chat_id, app.process_update(update))
+            elif kind == "export":
+                if chat_id in tails:
+                    await asyncio.gather(tails[chat_id], return_exceptions=True)
+                try:
+                    rows = await db.export_chat(chat_id)
+                except Exception as e:
+                    logger.error(f"Export of chat {chat_id} failed: {repr(e)}")
+                    rows = None
+                outbox.put(("exported", chat_id, rows))
+            elif kind == "release":
+                await db.release_chat_jobs(chat_id)
+                await bot_main.event_scheduler.reload()
+            elif kind == "delete":
+                await db.delete_chat(chat_id)
+                EventCache.instance().drop_chat(chat_id)
+                BanList.instance().drop_chat(chat_id)
+                TemplateCache.instance().drop_chat(chat_id)
+            elif kind == "import":
+                try:
+                    await db.import_chat(message[2])
+                    success = True
+                except Exception as e:
+                    logger.error(f"Import of chat {chat_id} failed: {repr(e)}")
+                    success = False
+                EventCache.instance().drop_chat(chat_id)
+                await BanList.instance().reload_chat(chat_id)
+                await TemplateCache.instance().reload_chat(chat_id)
+                # scheduled actions of imported events
+                await bot_main.event_scheduler.reload()
+                outbox.put(("imported", chat_id, success))
+        await asyncio.gather(*tails.values(), return_exceptions=True)
+        await bot_main.post_stop(app)
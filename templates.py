@@ -0,0 +1,164 @@
+"""
+Per-chat templates of events for KT Football bot
+©Viktor Sharov, 2024
+"""
+
+import datetime
+import logging
+import re
+
+from database import FootballBotDatabase
+from event import Event
+
+logger = logging.getLogger(__name__)
+
+# name of template used by /kt_add_event without "template=" parameter
+DEFAULT_TEMPLATE = "default"
+
+
+class EventTemplate:
+    """
+    Template compiled into prototype of events.
+    Parameters are the same as in /kt_add_event command, plus template-only parameters:
+      - weekdays: days of recurring events, e.g. "weekdays=вт,чт"
+      - publish_before: hours between publishing of recurring event message and event start
+    """
+
+    def __init__(self, name: str, params: str):
+        self.name = name
+        self.params = params
+        self.prototype = Event.compile_prototype(params)
+        # 0 - Monday ... 6 - Sunday
+        self.weekdays = set()
+        self.publish_before = 48.0
+        for reg_res in _TEMPLATE_PARAM_RE.finditer(params):
+            key = reg_res.group(1).lower()
+            value = reg_res.group(2).strip().lower()
+            if key in ("weekdays", "дні", "дни"):
+                self.weekdays = _parse_weekdays(value)
+            elif key in ("publish_before", "анонс"):
+                try:
+                    self.publish_before = float(value)
+                except ValueError:
+                    pass
+
+    def create_event(self, message_text: str = "", day: datetime.date = None) -> Event:
+        """New event with defaults of template updated by message parameters"""
+        return Event(message_text, prototype=self.prototype, day=day)
+
+    def recurring_events(self, weeks: int = 1) -> list[Event]:
+        """
+        Events of recurring schedule for next weeks, starting tomorrow.
+        Message of event is published publish_before hours before its start (immediately if that time passed)
+        """
+        events = []
+        now = datetime.datetime.now()
+        today = now.date()
+        for offset in range(1, 7 * weeks + 1):
+            day = today + datetime.timedelta(days=offset)
+            if day.weekday() in self.weekdays:
+                item = self.create_event(day=day)
+                publish_time = item.time - datetime.timedelta(hours=self.publish_before)
+                if publish_time > now:
+                    item.publish_time = publish_time
+                events.append(item)
+        return events
+
+    def describe(self) -> str:
+        return f"{self.name}: {self.params}"
+
+
+class TemplateCache:
+    """
+    Compiled templates of all chats, loaded once at start.
+    Lookup of template for new event is a dictionary access; templates are changed only through this class
+    """
+
+    #global instance
+    global_instance = None
+
+    def __init__(self):
+        # chat_id -> {name: EventTemplate}
+        self.__chats = {}
+
+    async def load(self):
+        """Load and compile templates of all chats"""
+        chats = {}
+        for chat_id, name, params in await FootballBotDatabase.instance().get_templates():
+            chats.setdefault(chat_id, {})[name] = EventTemplate(name, params)
+        self.__chats = chats
+        logger.info(f"Loaded templates of {len(chats)} chats")
+
+    async def reload_chat(self, chat_id: int):
+        """Load templates of chat again, e.g. after chat data was imported"""
+        rows = await FootballBotDatabase.instance().get_templates(chat_id)
+        self.__chats[chat_id] = {name: EventTemplate(name, params) for _, name, params in rows}
+
+    def drop_chat(self, chat_id: int):
+        self.__chats.pop(chat_id, None)
+
+    def get(self, chat_id: int, name: str = DEFAULT_TEMPLATE) -> EventTemplate:
+        """
+        :return: template of chat or None
+        """
+        return self.__chats.get(chat_id, {}).get(name)
+
+    def templates(self, chat_id: int) -> list[EventTemplate]:
+        return sorted(self.__chats.get(chat_id, {}).values(), key=lambda t: t.name)
+
+    async def save(self, chat_id: int, name: str, params: str) -> EventTemplate:
+        """Create or replace template of chat"""
+        template = EventTemplate(name, params)
+        await FootballBotDatabase.instance().save_template(chat_id, name, params)
+        self.__chats.setdefault(chat_id, {})[name] = template
+        return template
+
+    async def delete(self, chat_id: int, name: str) -> bool:
+        """
+        :return: False if chat has no such template
+        """
+        removed = await FootballBotDatabase.instance().delete_template(chat_id, name)
+        self.__chats.get(chat_id, {}).pop(name, None)
+        return removed
+
+    @staticmethod
+    def instance() -> "TemplateCache":
+        if TemplateCache.global_instance is None:
+            TemplateCache.global_instance = TemplateCache()
+        return TemplateCache.global_instance
+
+
+def template_name(message_text: str) -> str:
+    """
+    :return: value of "template=" parameter of message, DEFAULT_TEMPLATE if not given
+    """
+    for reg_res in _TEMPLATE_PARAM_RE.finditer(message_text):
+        if reg_res.group(1).lower() in ("template", "шаблон"):
+            return reg_res.group(2).strip()
+    return DEFAULT_TEMPLATE
+
+
+def _parse_weekdays(value: str) -> set:
+    weekdays = set()
+    for item in re.split(r"[\s,]+", value):
+        if item.isdigit() and 1 <= int(item) <= 7:
+            weekdays.add(int(item) - 1)
+            continue
+        for prefixes, weekday in _WEEKDAYS:
+            if item.startswith(prefixes):
+                weekdays.add(weekday)
+                break
+    return weekdays
+
+
+_TEMPLATE_PARAM_RE = re.compile(r"(\w+)[=:]([^;\n\r]+)")
+# (prefixes of weekday name, weekday); checked in order
+_WEEKDAYS = (
+    (("mo", "пн", "пон"), 0),
+    (("tu", "вт", "вів"), 1),
+    (("we", "ср", "сер"), 2),
+    (("th", "чт", "чет"), 3),
+    (("fr", "пт", "пят", "п'ят", "п’ят"), 4),
+    (("sa", "сб", "суб"), 5),
+    (("su", "нд", "вс", "нед", "вос"), 6),
+)